@@ -10,6 +10,7 @@ export default function App() {
   const [params, setParams] = useState({});
   const [downloadLink, setDownloadLink] = useState("");
   const [process,setProcess] = useState(false);
+  const [jobStatus, setJobStatus] = useState(null);
 
   const stepList = [
     { num: "1", name: "Resize" },
@@ -73,11 +74,30 @@ export default function App() {
 
     try {
       const res = await axios.post("http://localhost:4000/process", payload);
-      setDownloadLink(res.data.download_link);
+      // Cached results come back with their link right away
+      if (res.data.download_link) {
+        setDownloadLink(res.data.download_link);
+        setProcess(false)
+        return;
+      }
+      // The server queues the job, poll until it is finished
+      let job = null;
+      do {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        job = (await axios.get(res.data.status_url)).data;
+        setJobStatus(job);
+      } while (job.status === "queued" || job.status === "running");
+
+      if (job.status === "done") {
+        setDownloadLink(job.result.download_link);
+      } else {
+        alert(`Job ${job.status}${job.error ? ": " + job.error : ""}`);
+      }
       setProcess(false)
     } catch (err) {
       console.error(err);
       alert("Something went wrong!");
+      setProcess(false)
     }
   };
 
@@ -284,7 +304,7 @@ export default function App() {
     
       {
         process? <button  style={{ marginTop: 20 }}>
-        Processing Please wait.....
+        Processing Please wait..... {jobStatus ? `(${jobStatus.stage})` : ""}
       </button>:<button onClick={handleSubmit} style={{ marginTop: 20 }}>
         Process Images
       </button>
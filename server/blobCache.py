@@ -0,0 +1,151 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from config import BLOB_CACHE_DIR, BLOB_CACHE_FRESH_SECONDS, BLOB_CACHE_MAX_BYTES
+
+
+# ===== Shared cache of downloaded images =====
+# Blobs are stored once per content hash under blobs/<sha256>, so the same file reached through
+# different URLs takes up space only once. SQLite maps every URL to its blob together with the
+# ETag / Last-Modified the server sent. Within BLOB_CACHE_FRESH_SECONDS a cached URL is served
+# without touching the network; after that it is revalidated with a conditional GET. Blobs are
+# hardlinked into job folders, and the least recently used ones are dropped past the size budget.
+class BlobCache:
+    def __init__(self, folder=BLOB_CACHE_DIR, max_bytes=BLOB_CACHE_MAX_BYTES, fresh_seconds=BLOB_CACHE_FRESH_SECONDS):
+        self.folder = folder
+        self.blobs = os.path.join(folder, "blobs")
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    # Opened on first use, so importing the downloader creates no files. Callers hold the lock.
+    @property
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(self.blobs, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.folder, "index.sqlite"), check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    url TEXT PRIMARY KEY, sha TEXT NOT NULL, etag TEXT, last_modified TEXT, checked_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS blobs (sha TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS urls_sha ON urls (sha);
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def blob_path(self, sha):
+        return os.path.join(self.blobs, sha)
+
+    # (sha, etag, last_modified, fresh) for a cached URL, or None
+    def lookup(self, url):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha, etag, last_modified, checked_at FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row[0])):
+            return None
+        sha, etag, last_modified, checked_at = row
+        return sha, etag, last_modified, time.time() - checked_at < self.fresh_seconds
+
+    # Headers that let the server answer 304 instead of sending the file again
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry and entry[1]:
+            headers["If-None-Match"] = entry[1]
+        if entry and entry[2]:
+            headers["If-Modified-Since"] = entry[2]
+        return headers
+
+    # Puts the cached blob at file_path; False if it was evicted in the meantime.
+    # revalidated_url is the URL the server just confirmed with a 304.
+    def materialize(self, sha, file_path, revalidated_url=None):
+        try:
+            _link_or_copy(self.blob_path(sha), file_path)
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            now = time.time()
+            self._db.execute("UPDATE blobs SET last_used = ? WHERE sha = ?", (now, sha))
+            if revalidated_url:
+                self._db.execute("UPDATE urls SET checked_at = ? WHERE url = ?", (now, revalidated_url))
+            self._db.commit()
+            if revalidated_url:
+                self.revalidated += 1
+            else:
+                self.hits += 1
+            self.bytes_saved += os.path.getsize(file_path)
+        return True
+
+    # Records a fresh download; the file itself stays where it is and the blob is a link to it
+    def store(self, url, file_path, sha, etag=None, last_modified=None):
+        size = os.path.getsize(file_path)
+        blob = self.blob_path(sha)
+        os.makedirs(self.blobs, exist_ok=True)
+        if not os.path.exists(blob):
+            try:
+                _link_or_copy(file_path, blob)
+            except FileExistsError:
+                pass  # another thread stored the same content first
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO urls (url, sha, etag, last_modified, checked_at) VALUES (?, ?, ?, ?, ?)",
+                (url, sha, etag, last_modified, now),
+            )
+            self._db.execute("INSERT OR REPLACE INTO blobs (sha, size, last_used) VALUES (?, ?, ?)", (sha, size, now))
+            self._evict()
+            self._db.commit()
+
+    # The URL had to be downloaded, whether or not the cache knew it before
+    def count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for sha, size in self._db.execute("SELECT sha, size FROM blobs ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM blobs WHERE sha = ?", (sha,))
+            self._db.execute("DELETE FROM urls WHERE sha = ?", (sha,))
+            if os.path.exists(self.blob_path(sha)):
+                os.remove(self.blob_path(sha))
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            blobs, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "bytes_saved": self.bytes_saved,
+                "blobs": blobs,
+                "bytes": size,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        raise
+    except OSError:
+        shutil.copy(src, dst)
@@ -0,0 +1,76 @@
+import os
+
+# All server settings live here and can be overridden with environment variables.
+
+# ===== Server =====
+PUBLIC_URL = os.environ.get("PUBLIC_URL", "http://localhost:4000")
+
+# ===== Job queue =====
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", max(2, (os.cpu_count() or 4) // 4)))  # jobs that run at the same time
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 3600))  # keep finished job status this long
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", 32))  # jobs waiting for a worker before /process answers 429
+JOB_IMAGE_LIMIT = int(os.environ.get("JOB_IMAGE_LIMIT", 10000))  # images asked for by all queued and running jobs together
+CLIENT_RATE_LIMIT = float(os.environ.get("CLIENT_RATE_LIMIT", 30))  # new jobs per client per minute, 0 = no limit
+CLIENT_BURST = int(os.environ.get("CLIENT_BURST", 10))  # jobs a client may submit at once before the rate applies
+
+# ===== Workspaces =====
+WORKSPACE_ROOT = os.environ.get("WORKSPACE_ROOT", "./workspaces")  # one sub-folder per job
+WORKSPACE_TTL_SECONDS = int(os.environ.get("WORKSPACE_TTL_SECONDS", 300))  # delete finished jobs' files after 5 minutes
+
+# ===== Selenium driver pool =====
+DRIVER_POOL_SIZE = int(os.environ.get("DRIVER_POOL_SIZE", 3))  # warm headless Chrome instances
+DRIVER_MAX_USES = int(os.environ.get("DRIVER_MAX_USES", 20))   # recycle a browser after this many scrapes
+
+# ===== Scraping =====
+SCRAPE_MODE = os.environ.get("SCRAPE_MODE", "fanout")  # "fanout": all sources at once, "sequential": one after another
+
+# ===== Scrape -> download -> process pipeline =====
+JOB_ENGINE = os.environ.get("JOB_ENGINE", "pipeline")  # "pipeline": stages overlap, "batch": scrape everything, then process
+PIPELINE_DOWNLOAD_WORKERS = int(os.environ.get("PIPELINE_DOWNLOAD_WORKERS", 8))  # per job, DOWNLOAD_WORKERS still caps requests across jobs
+PIPELINE_PROCESS_WORKERS = int(os.environ.get("PIPELINE_PROCESS_WORKERS", min(8, os.cpu_count() or 4)))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 32))  # items waiting between two stages
+
+# ===== Downloader =====
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", 16))      # concurrent downloads across all jobs
+DOWNLOAD_PER_HOST = int(os.environ.get("DOWNLOAD_PER_HOST", 6))     # concurrent downloads from one host
+DOWNLOAD_BANDWIDTH_LIMIT = int(os.environ.get("DOWNLOAD_BANDWIDTH_LIMIT", 0))  # bytes per second for all downloads, 0 = no cap
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", 64 * 1024))
+DOWNLOAD_TIMEOUT = int(os.environ.get("DOWNLOAD_TIMEOUT", 10))
+BLOB_CACHE_DIR = os.environ.get("BLOB_CACHE_DIR", "./blob_cache")  # downloaded images shared by all jobs
+BLOB_CACHE_MAX_BYTES = int(os.environ.get("BLOB_CACHE_MAX_BYTES", 10 * 1024**3))  # 0 turns the cache off
+BLOB_CACHE_FRESH_SECONDS = int(os.environ.get("BLOB_CACHE_FRESH_SECONDS", 7 * 24 * 3600))  # revalidate with the server after this
+
+# ===== Scroll engine =====
+SCROLL_TIMEOUT = float(os.environ.get("SCROLL_TIMEOUT", 10))       # longest wait for new results after a scroll
+SCROLL_MIN_TIMEOUT = float(os.environ.get("SCROLL_MIN_TIMEOUT", 1.5))  # shortest wait, even for fast sources
+SCROLL_NO_GROWTH_LIMIT = int(os.environ.get("SCROLL_NO_GROWTH_LIMIT", 3))  # give up after this many scrolls with nothing new
+SCRAPE_BACKEND = os.environ.get("SCRAPE_BACKEND", "http")  # "http": plain HTTP where possible, Selenium as fallback; "browser": Selenium only
+PICJUMBO_BASE_URL = os.environ.get("PICJUMBO_BASE_URL", "https://picjumbo.com")  # point these at a local server for testing
+WIKIMEDIA_API_URL = os.environ.get("WIKIMEDIA_API_URL", "https://commons.wikimedia.org/w/api.php")
+HTTP_PAGE_CONCURRENCY = int(os.environ.get("HTTP_PAGE_CONCURRENCY", 4))  # search pages fetched at once per source
+
+# ===== Image processing =====
+# PROCESS_BACKEND and PROCESS_WORKERS pick how a finished folder is processed: JOB_ENGINE="batch",
+# and jobs reusing another job's scrape. The pipeline engine always streams images through the
+# staged processor, using the PROCESS_READ/WRITE_WORKERS and PROCESS_QUEUE_SIZE settings below
+# with PIPELINE_PROCESS_WORKERS transform threads.
+PROCESS_BACKEND = os.environ.get("PROCESS_BACKEND", "staged")  # "staged", "vectorized", "threads", "processes" or "hybrid" (processes running threads)
+PROCESS_WORKERS = int(os.environ.get("PROCESS_WORKERS", 0))     # 0 = tune from core count and image size
+PROCESS_MEMORY_BUDGET = int(os.environ.get("PROCESS_MEMORY_BUDGET", 2 * 1024**3))  # bytes of decoded images in flight
+PROCESS_READ_WORKERS = int(os.environ.get("PROCESS_READ_WORKERS", 4))  # staged backend: threads reading and decoding
+PROCESS_TRANSFORM_WORKERS = int(os.environ.get("PROCESS_TRANSFORM_WORKERS", min(8, os.cpu_count() or 4)))
+PROCESS_WRITE_WORKERS = int(os.environ.get("PROCESS_WRITE_WORKERS", 4))  # staged backend: threads encoding and writing
+PROCESS_QUEUE_SIZE = int(os.environ.get("PROCESS_QUEUE_SIZE", 16))  # decoded images waiting between two stages
+PROCESS_BATCH_SIZE = int(os.environ.get("PROCESS_BATCH_SIZE", 32))  # vectorized backend: images stacked into one array
+
+# ===== Dataset exports =====
+EXPORT_SHARD_SIZE = int(os.environ.get("EXPORT_SHARD_SIZE", 1024**3))  # bytes per tar shard
+
+# ===== Result cache =====
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "./result_cache")  # finished archives of earlier requests
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", 24 * 3600))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 5 * 1024**3))  # least recently served go first
+
+# ===== Query index =====
+QUERY_INDEX_PATH = os.environ.get("QUERY_INDEX_PATH", "./query_index.sqlite")  # URLs and cursors per query, "" turns it off
+QUERY_INDEX_RECHECK_SECONDS = int(os.environ.get("QUERY_INDEX_RECHECK_SECONDS", 24 * 3600))  # look for new results after a search ran out
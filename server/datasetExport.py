@@ -0,0 +1,160 @@
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+
+import numpy as np
+
+
+# ===== Memory-mapped NumPy export =====
+# One preallocated N x H x W x C uint8 .npy file per job. Processing threads copy each final
+# image straight into its row of the memmap, so the dataset is ready as soon as the last image
+# is done, with no second decode pass. An index file maps every row back to its source.
+class NpyDataset:
+    def __init__(self, path, capacity, shape, variants=1):
+        self.path = path
+        self.index_path = path + ".index.jsonl"
+        self.shape = tuple(shape)
+        self.capacity = capacity
+        self.variants = variants  # augmented jobs give one row per variant
+        self.array = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(capacity, *self.shape))
+        self.rows = []  # row -> (source image file, variant)
+        self._lock = threading.Lock()
+
+    # Sinks get the outputs of every finished image and the files written for it;
+    # the last output of each variant is what the plan produced
+    def add(self, img_file, outputs, paths):
+        if not outputs:
+            return
+        per_variant = len(outputs) // self.variants
+        finals = [img for _, img in outputs[per_variant - 1::per_variant]]
+        for img in finals:
+            if img.shape != self.shape:
+                raise ValueError(f"{img_file} is {img.shape}, the dataset expects {self.shape}")
+        with self._lock:
+            first = len(self.rows)
+            if first + len(finals) > self.capacity:
+                print(f"⚠️ Dataset is full, {img_file} left out")
+                return
+            self.rows.extend((img_file, variant) for variant in range(len(finals)))
+        for i, img in enumerate(finals):
+            self.array[first + i] = img
+
+    # Flushes the rows, drops the unused tail and writes the index next to the .npy
+    def finish(self, manifest=None):
+        manifest = manifest or {}
+        self.array.flush()
+        del self.array
+        _shrink_npy(self.path, len(self.rows))
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            for row, (img_file, variant) in enumerate(self.rows):
+                entry = manifest.get(img_file, {})
+                f.write(json.dumps({
+                    "row": row,
+                    "name": img_file,
+                    "variant": variant,
+                    "url": entry.get("url"),
+                    "source": entry.get("source"),
+                }) + "\n")
+        print(f"📦 Wrote {len(self.rows)} rows of {self.shape} to {self.path}")
+        return self.path, self.index_path
+
+
+# ===== Sharded tar export =====
+# WebDataset layout: every image becomes a sample whose files share one key, e.g. 12.original.jpg,
+# 12.resize_rotate.jpg and 12.json with the source metadata. Samples are appended as soon as they
+# are written and a shard is closed once it passes shard_size, so finished shards can be
+# downloaded while the job is still running. A sample never spans two shards.
+class TarShards:
+    def __init__(self, folder, prefix, shard_size, manifest_path=None, on_shard=None):
+        self.folder = folder
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.manifest_path = manifest_path
+        self.on_shard = on_shard  # called with the path of every finished shard
+        self.shards = []
+        self.samples = 0
+        self._tar = None
+        self._tar_path = None
+        self._manifest = {}
+        self._manifest_offset = 0
+        self._lock = threading.Lock()
+
+    def add(self, img_file, outputs, paths):
+        key = os.path.splitext(img_file)[0]
+        with self._lock:
+            if self._tar is None:
+                self._open()
+            for path in paths:
+                # "12_resize_rotate.jpg" -> "12.resize_rotate.jpg"
+                name = os.path.basename(path)
+                self._tar.add(path, arcname=f"{key}.{name[len(key) + 1:]}")
+            metadata = dict(self._metadata(img_file))
+            metadata.update({"key": key, "name": img_file, "files": [os.path.basename(p) for p in paths]})
+            self._add_bytes(f"{key}.json", json.dumps(metadata).encode("utf-8"))
+            self.samples += 1
+            if self._tar.fileobj.tell() >= self.shard_size:
+                self._close()
+
+    def finish(self, manifest=None):
+        with self._lock:
+            if self._tar is not None:
+                self._close()
+        print(f"📦 Wrote {self.samples} samples into {len(self.shards)} tar shards")
+        return list(self.shards)
+
+    def _open(self):
+        self._tar_path = os.path.join(self.folder, f"{self.prefix}-{len(self.shards):06d}.tar")
+        self._tar = tarfile.open(self._tar_path + ".part", "w")
+
+    # The shard only gets its final name once complete, so clients never download half a shard
+    def _close(self):
+        self._tar.close()
+        os.replace(self._tar_path + ".part", self._tar_path)
+        self.shards.append(self._tar_path)
+        self._tar = None
+        if self.on_shard:
+            self.on_shard(self._tar_path)
+
+    def _add_bytes(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+
+    # The manifest grows while the pipeline downloads, so read only the lines added since last time
+    def _metadata(self, img_file):
+        if img_file not in self._manifest and self.manifest_path and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                f.seek(self._manifest_offset)
+                for line in iter(f.readline, ""):
+                    if not line.endswith("\n"):
+                        break  # half-written line, read it next time
+                    self._manifest_offset = f.tell()
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._manifest[entry["file"]] = entry
+        return self._manifest.get(img_file, {})
+
+
+# Rewrites the header with the new row count, padded to its old length, and truncates the data
+def _shrink_npy(path, rows):
+    with open(path, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            length_size = 2
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            length_size = 4
+        data_offset = f.tell()
+        if rows == shape[0]:
+            return
+        new_shape = (rows, *shape[1:])
+        header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": fortran_order, "shape": new_shape})
+        header_start = 6 + 2 + length_size  # magic string, version, header length
+        f.seek(header_start)
+        f.write(header.ljust(data_offset - header_start - 1).encode("latin1") + b"\n")
+        f.truncate(data_offset + rows * int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize)
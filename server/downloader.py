@@ -0,0 +1,124 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+from blobCache import BlobCache
+from config import (
+    BLOB_CACHE_MAX_BYTES, DOWNLOAD_BANDWIDTH_LIMIT, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_PER_HOST,
+    DOWNLOAD_TIMEOUT, DOWNLOAD_WORKERS,
+)
+
+
+# ===== Total bandwidth cap =====
+class TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate  # bytes per second, 0 = unlimited
+        self._tokens = rate
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+# ===== Connection-pooled concurrent downloader =====
+# One keep-alive session for every download, so repeated hosts skip the TCP/TLS handshake.
+class Downloader:
+    def __init__(self, max_workers=DOWNLOAD_WORKERS, per_host=DOWNLOAD_PER_HOST,
+                 bandwidth=DOWNLOAD_BANDWIDTH_LIMIT, chunk_size=DOWNLOAD_CHUNK_SIZE, timeout=DOWNLOAD_TIMEOUT,
+                 cache=None):
+        self.cache = cache  # BlobCache checked before every request, None to always download
+        self.per_host = per_host
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.bucket = TokenBucket(bandwidth)
+        # Pipeline workers call fetch() directly, so the cap on connections is enforced here
+        # rather than by the executor: never more requests open than the session pools
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download")
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    # Downloads in the calling thread, returns True when the file is complete on disk
+    def fetch(self, url, file_path):
+        cached = self.cache.lookup(url) if self.cache else None
+        if cached and cached[3] and self.cache.materialize(cached[0], file_path):
+            return True
+
+        part_path = file_path + ".part"
+        try:
+            headers = self.cache.conditional_headers(cached) if self.cache else {}
+            while True:
+                digest = hashlib.sha256()
+                with self._host_slot(url), self._slots:
+                    with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as response:
+                        if response.status_code == 304:
+                            if cached and self.cache.materialize(cached[0], file_path, revalidated_url=url):
+                                return True
+                            if headers:
+                                headers = {}  # blob evicted since the lookup, ask for the whole file
+                                continue
+                            return False
+                        if response.status_code != 200:
+                            return False
+                        # Written under a temporary name so readers never see half a file
+                        with open(part_path, 'wb', buffering=self.chunk_size * 4) as f:
+                            for chunk in response.iter_content(self.chunk_size):
+                                self.bucket.consume(len(chunk))
+                                digest.update(chunk)
+                                f.write(chunk)
+                break
+            os.replace(part_path, file_path)
+            if self.cache:
+                self.cache.count_miss()
+                self.cache.store(url, file_path, digest.hexdigest(),
+                                 response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            return True
+        except Exception as e:
+            tqdm.write(f"[!] Failed to download {url[:50]}... Reason: {e}")
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return False
+
+    def submit(self, url, file_path):
+        return self._executor.submit(self.fetch, url, file_path)
+
+    # Runs a callable that ends in fetch() on the download threads
+    def submit_task(self, fn, *args):
+        return self._executor.submit(fn, *args)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+        if self.cache:
+            self.cache.close()
+
+
+downloader = Downloader(cache=BlobCache() if BLOB_CACHE_MAX_BYTES > 0 else None)
@@ -0,0 +1,167 @@
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+from config import DRIVER_MAX_USES, DRIVER_POOL_SIZE
+
+
+# The caller stopped (or the pool closed) before a browser became free
+class DriverUnavailable(Exception):
+    pass
+
+
+# ===== Pool of warm headless Chrome drivers =====
+# Browsers are started once and checked out per scrape instead of paying a cold start every time.
+class DriverPool:
+    def __init__(self, size=DRIVER_POOL_SIZE, max_uses=DRIVER_MAX_USES):
+        self.size = size
+        self.max_uses = max_uses
+        self._idle = queue.Queue()
+        self._uses = {}
+        self._created = 0
+        self._driver_path = None
+        self._lock = threading.Lock()
+        self._path_lock = threading.Lock()  # held across the install, never together with _lock
+        self._closed = False
+
+    # Called at server start so the first request already finds warm browsers
+    def start(self):
+        self._closed = False
+        self._resolve_driver_path()
+        for _ in range(self.size):
+            if not self._reserve_slot():
+                break
+            self._add_new_driver()
+        print(f"🚗 Driver pool ready with {self._idle.qsize()} browsers")
+
+    # ChromeDriverManager may hit the network, so it runs only once per process and under its
+    # own lock: slot bookkeeping and stats() (called from the event loop) never wait for it
+    def _resolve_driver_path(self):
+        with self._path_lock:
+            if self._driver_path is None:
+                self._driver_path = ChromeDriverManager().install()
+            return self._driver_path
+
+    def _new_driver(self):
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--window-size=1920x1080")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        service = Service(self._resolve_driver_path())
+        driver = webdriver.Chrome(service=service, options=chrome_options)
+        self._uses[id(driver)] = 0
+        return driver
+
+    def _reserve_slot(self):
+        with self._lock:
+            if self._created >= self.size:
+                return False
+            self._created += 1
+            return True
+
+    def _release_slot(self):
+        with self._lock:
+            self._created -= 1
+
+    def _add_new_driver(self):
+        try:
+            self._idle.put(self._new_driver())
+        except Exception as e:
+            self._release_slot()
+            print(f"❌ Could not start a browser: {e}")
+
+    # Waits in short steps: a replacement browser that fails to start frees its slot without
+    # putting anything on the queue, so every pass tries to take that slot itself
+    def _acquire(self, job=None, stop_event=None):
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            # Pool not full yet (lazy start or a browser was recycled): start one for this caller
+            if self._reserve_slot():
+                try:
+                    return self._new_driver()
+                except Exception:
+                    self._release_slot()
+                    raise
+            try:
+                return self._idle.get(timeout=1)
+            except queue.Empty:
+                pass
+            if job:
+                job.check_cancelled()
+            if stop_event is not None and stop_event.is_set():
+                raise DriverUnavailable("stopped while waiting for a browser")
+            if self._closed:
+                raise DriverUnavailable("driver pool is closed")
+
+    @contextmanager
+    def driver(self, job=None, stop_event=None):
+        driver = self._acquire(job, stop_event)
+        crashed = False
+        try:
+            yield driver
+        except WebDriverException:
+            crashed = True
+            raise
+        finally:
+            self._checkin(driver, crashed)
+
+    def _checkin(self, driver, crashed):
+        self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+        if not crashed and not self._closed and self._uses[id(driver)] < self.max_uses:
+            try:
+                # Reset so the next scrape does not see this one's cookies or page
+                driver.delete_all_cookies()
+                driver.get("about:blank")
+                self._idle.put(driver)
+                return
+            except WebDriverException:
+                pass
+        self._recycle(driver)
+
+    def _recycle(self, driver):
+        self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        self._release_slot()
+        # Warm a replacement in the background so the next checkout does not wait for it
+        if not self._closed and self._reserve_slot():
+            threading.Thread(target=self._add_new_driver, daemon=True).start()
+
+    # Every scrape shares these browsers, so size is also the cap on Chrome processes
+    def stats(self):
+        with self._lock:
+            started = self._created
+        idle = self._idle.qsize()
+        return {"browsers": started, "idle": idle, "in_use": max(0, started - idle), "limit": self.size}
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._uses.pop(id(driver), None)
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            self._release_slot()
+
+
+driver_pool = DriverPool()
+atexit.register(driver_pool.close)
@@ -0,0 +1,141 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from config import DOWNLOAD_TIMEOUT, HTTP_PAGE_CONCURRENCY, PICJUMBO_BASE_URL, WIKIMEDIA_API_URL
+
+# lxml is much faster than the built-in parser but optional
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# Pooled keep-alive session shared by every browserless source
+def http_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_PAGE_CONCURRENCY * 4)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers["User-Agent"] = USER_AGENT
+        return _session
+
+
+# ===== Picjumbo =====
+def picjumbo_page_url(query, page_number):
+    base_url = f"{PICJUMBO_BASE_URL}/search/{query.lower().replace(' ', '-')}/"
+    return base_url if page_number == 1 else f"{base_url.rstrip('/')}/page/{page_number}/"
+
+# Shared by the browser and the HTTP backend, adds new URLs to image_urls
+def parse_picjumbo_page(html, image_urls):
+    soup = BeautifulSoup(html, HTML_PARSER)
+    new_images = []
+    for picture in soup.find_all("picture"):
+        img = picture.find("img")
+        if img and img.get("class") == ["image"]:
+            src = img.get("src")
+            if src:
+                if src.startswith("//"):
+                    src = "https:" + src
+                elif src.startswith("/"):
+                    src = urljoin(PICJUMBO_BASE_URL, src)
+                if src not in image_urls:
+                    image_urls.add(src)
+                    new_images.append({
+                        "url": src,
+                        "width": img.get("width"),
+                        "height": img.get("height"),
+                        "alt": img.get("alt", ""),
+                    })
+    return new_images
+
+def _fetch_page(url):
+    response = http_session().get(url, timeout=DOWNLOAD_TIMEOUT)
+    if response.status_code == 404:
+        return None  # ran past the last page
+    response.raise_for_status()
+    return response.text
+
+# Search pages are static HTML: fetch several at once, yield them in page order
+def http_picjumbo_images(query, job=None, stop_event=None, position=None):
+    image_urls = set()
+    page_number = position.value if position and position.value else 1
+
+    print("\n⚡ Fetching Picjumbo pages over HTTP...")
+    with ThreadPoolExecutor(max_workers=HTTP_PAGE_CONCURRENCY, thread_name_prefix="picjumbo") as executor:
+        while True:
+            pages = [picjumbo_page_url(query, page_number + i) for i in range(HTTP_PAGE_CONCURRENCY)]
+            for offset, (page_url, html) in enumerate(zip(pages, executor.map(_fetch_page, pages))):
+                if job:
+                    job.check_cancelled()
+                if stop_event is not None and stop_event.is_set():
+                    return
+                new_images = parse_picjumbo_page(html, image_urls) if html else []
+                if not new_images:
+                    print(f"⚠️ No new images on {page_url}. Stopping further scraping.")
+                    if position:
+                        position.exhausted = True
+                    return
+                if position:
+                    position.advance(page_number + offset + 1, new_images)
+                yield from new_images
+            page_number += HTTP_PAGE_CONCURRENCY
+
+
+# ===== Wikimedia Commons search API =====
+def http_wikimedia_images(query, job=None, stop_event=None, position=None, batch_size=50):
+    image_urls = set()
+    params = {
+        "action": "query",
+        "format": "json",
+        "generator": "search",
+        "gsrsearch": f"{query} filetype:bitmap",
+        "gsrnamespace": 6,  # File: pages
+        "gsrlimit": batch_size,
+        "prop": "imageinfo",
+        "iiprop": "url|size|mime",
+    }
+    cursor = position.value if position and position.value else {"continue": ""}
+
+    print("\n⚡ Querying the Wikimedia API...")
+    while cursor is not None:
+        if job:
+            job.check_cancelled()
+        if stop_event is not None and stop_event.is_set():
+            return
+        response = http_session().get(WIKIMEDIA_API_URL, params={**params, **cursor}, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+
+        pages = sorted(data.get("query", {}).get("pages", {}).values(), key=lambda p: p.get("index", 0))
+        new_images = []
+        for page in pages:
+            for info in page.get("imageinfo", []):
+                src = info.get("url")
+                if src and info.get("mime") in ("image/jpeg", "image/png") and src not in image_urls:
+                    image_urls.add(src)
+                    new_images.append({
+                        "url": src,
+                        "width": info.get("width"),
+                        "height": info.get("height"),
+                        "alt": page.get("title", ""),
+                    })
+        print(f"🔗 Wikimedia API returned {len(image_urls)} image links...")
+        cursor = data.get("continue")
+        if position:
+            position.advance(cursor, new_images)
+            position.exhausted = cursor is None
+        yield from new_images
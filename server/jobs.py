@@ -0,0 +1,231 @@
+import math
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from config import JOB_IMAGE_LIMIT, JOB_QUEUE_LIMIT, JOB_RETENTION_SECONDS
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# The server is at capacity; retry_after is an estimate in seconds of when a slot frees up
+class QueueFull(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# ===== A single queued request =====
+class Job:
+    def __init__(self, request):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.status = "queued"  # queued -> running -> done / failed / cancelled
+        self.stage = "queued"   # scraping -> processing -> zipping
+        self.progress = {}
+        self.result = {}
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self.key = None  # canonical request key, identical requests attach to this job
+        self.subscribers = 1  # callers sharing this job, it is only cancelled when all of them leave
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    # Workers call this between units of work so DELETE /jobs/{id} takes effect quickly
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.id)
+
+    def set_stage(self, stage):
+        self.check_cancelled()
+        with self._lock:
+            self.stage = stage
+
+    def report(self, **counters):
+        with self._lock:
+            self.progress.update(counters)
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self.progress[counter] = self.progress.get(counter, 0) + amount
+
+    # Files that can be downloaded before the job is done, such as finished tar shards
+    def publish(self, name, url):
+        with self._lock:
+            self.result["exports"] = {**self.result.get("exports", {}), name: url}
+
+    def is_finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": dict(self.progress),
+                "result": dict(self.result),
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+# ===== Bounded pool of background workers =====
+# Jobs past the running ones wait in order, up to max_queued of them and max_images images
+# across everything queued or running; beyond that submit raises QueueFull.
+class JobManager:
+    def __init__(self, runner, max_workers, max_queued=JOB_QUEUE_LIMIT, max_images=JOB_IMAGE_LIMIT):
+        self.runner = runner  # runner(job) does the actual scrape -> process -> zip
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_images = max_images
+        self.jobs = {}
+        self.rejected = {"queue_full": 0, "too_many_images": 0}
+        self._in_flight = {}  # canonical key -> queued or running job
+        self._queue = []  # queued jobs, oldest first
+        self._avg_run_seconds = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    # Returns (job, attached): attached is True when an identical request was already in flight
+    def submit(self, request, key=None):
+        self.prune()
+        with self._lock:
+            running = self._in_flight.get(key) if key else None
+            if running is not None and not running.is_finished() and not running.is_cancelled():
+                running.subscribers += 1
+                return running, True
+            self._admit(request)
+            job = Job(request)
+            job.key = key
+            self.jobs[job.id] = job
+            self._queue.append(job)
+            if key:
+                self._in_flight[key] = job
+        job.future = self._executor.submit(self._run, job)
+        return job, False
+
+    # Called with the lock held. A request larger than max_images still runs once nothing else does.
+    def _admit(self, request):
+        if len(self._queue) >= self.max_queued:
+            self.rejected["queue_full"] += 1
+            raise QueueFull("job queue is full", self._retry_after(len(self._queue) - self.max_queued + 1))
+        images = sum(j.request.num_images for j in self.jobs.values() if not j.is_finished())
+        if images and images + request.num_images > self.max_images:
+            self.rejected["too_many_images"] += 1
+            raise QueueFull("too many images queued", self._retry_after(1))
+
+    # Seconds until `jobs` more jobs have finished, judging by how long recent jobs ran
+    def _retry_after(self, jobs):
+        avg = self._avg_run_seconds if self._avg_run_seconds is not None else 30
+        return max(1, math.ceil(avg * jobs / self.max_workers))
+
+    # 1 for the next job to start, None once it is running
+    def queue_position(self, job):
+        with self._lock:
+            return self._queue.index(job) + 1 if job in self._queue else None
+
+    def stats(self):
+        with self._lock:
+            active = [j for j in self.jobs.values() if not j.is_finished()]
+            return {
+                "running": sum(1 for j in active if j.status == "running"),
+                "queued": len(self._queue),
+                "images_in_flight": sum(j.request.num_images for j in active),
+                "workers": self.max_workers,
+                "queue_limit": self.max_queued,
+                "image_limit": self.max_images,
+                "avg_run_seconds": self._avg_run_seconds,
+                "rejected": dict(self.rejected),
+            }
+
+    # A request answered without running anything, e.g. from the result cache
+    def add_finished(self, request, result):
+        job = Job(request)
+        job.result.update(result)
+        job.started_at = job.created_at
+        self._finish(job, "done")
+        with self._lock:
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            if job.subscribers > 1:
+                # Someone else is still waiting for this result
+                job.subscribers -= 1
+                return job
+        job.cancel()
+        # Jobs that never left the queue can be dropped right away
+        if job.future is not None and job.future.cancel():
+            self._finish(job, "cancelled")
+        return job
+
+    def _run(self, job):
+        if job.is_cancelled():
+            self._finish(job, "cancelled")
+            return
+        with self._lock:
+            if job in self._queue:
+                self._queue.remove(job)
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            self.runner(job)
+            self._finish(job, "done")
+        except JobCancelled:
+            print(f"🛑 Job {job.id} cancelled during {job.stage}")
+            self._finish(job, "cancelled")
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            self._finish(job, "failed")
+
+    def _finish(self, job, status):
+        job.status = status
+        job.stage = status
+        job.finished_at = time.time()
+        with self._lock:
+            if job.key and self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+            if job in self._queue:
+                self._queue.remove(job)
+            if status == "done" and job.started_at is not None and job.future is not None:
+                seconds = job.finished_at - job.started_at
+                avg = self._avg_run_seconds
+                self._avg_run_seconds = seconds if avg is None else 0.8 * avg + 0.2 * seconds
+
+    # Forget finished jobs once their files have long been deleted
+    def prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        with self._lock:
+            for job_id in [j.id for j in self.jobs.values() if j.is_finished() and j.finished_at < cutoff]:
+                del self.jobs[job_id]
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -3,9 +3,15 @@ import cv2
 import numpy as np
 from tqdm import tqdm
 import shutil 
-import threading 
+import random
+import multiprocessing
+import queue
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from config import (PROCESS_BACKEND, PROCESS_BATCH_SIZE, PROCESS_MEMORY_BUDGET, PROCESS_QUEUE_SIZE, PROCESS_READ_WORKERS,
+                    PROCESS_TRANSFORM_WORKERS, PROCESS_WORKERS, PROCESS_WRITE_WORKERS)
 
 # ====== Define processing functions ======
 def resize_image(img, width, height):
@@ -24,100 +30,686 @@ def rotate_image(img, angle):
     return cv2.warpAffine(img, M, (w, h))
 
 def adjust_brightness(img, factor):
-    return cv2.convertScaleAbs(img, alpha=factor, beta=0)
+    return apply_lut(img, scale_lut(factor))
 
 def adjust_contrast(img, factor):
-    return cv2.convertScaleAbs(img, alpha=factor, beta=0)
+    return apply_lut(img, scale_lut(factor))
 
 def adjust_saturation(img, factor):
+    return apply_saturation_lut(img, saturation_lut(factor))
+
+def flip_image(img, flip_code):
+    return cv2.flip(img, flip_code)
+
+
+# ====== Lookup tables for point operations ======
+# Brightness, contrast and saturation map every byte value on its own, so a 256-entry table
+# computed once per job gives the same bytes as doing the arithmetic on every pixel.
+_IDENTITY = np.arange(256, dtype=np.uint8)
+
+# Same values as cv2.convertScaleAbs(img, alpha=factor, beta=0)
+def scale_lut(factor):
+    return cv2.convertScaleAbs(_IDENTITY, alpha=factor, beta=0).reshape(256)
+
+# Same values as scaling the S channel in float32, clipping and casting back to uint8
+def saturation_lut(factor):
+    return np.clip(np.arange(256, dtype=np.float32) * np.float32(factor), 0, 255).astype(np.uint8)
+
+def apply_lut(img, lut):
+    return cv2.LUT(img, lut)
+
+def apply_saturation_lut(img, lut):
     if len(img.shape) == 2 or img.shape[2] == 1:
         return img
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV).astype(np.float32)
-    hsv[..., 1] *= factor
-    hsv[..., 1] = np.clip(hsv[..., 1], 0, 255)
-    hsv = hsv.astype(np.uint8)
+    h, s, v = cv2.split(cv2.cvtColor(img, cv2.COLOR_BGR2HSV))
+    hsv = cv2.merge((h, cv2.LUT(s, lut), v))
     return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
 
-def flip_image(img, flip_code):
-    return cv2.flip(img, flip_code)
+# Step name -> (table builder, applier) for steps the plan runs as lookup tables
+POINT_OPS = {
+    "brightness": (scale_lut, apply_lut),
+    "contrast": (scale_lut, apply_lut),
+    "saturation": (saturation_lut, apply_saturation_lut),
+}
 
 
-# ====== Helper function to process single image ======
-def process_single_image(img_file, input_folder, output_folder, selected_steps, step_map, params):
-    img_path = os.path.join(input_folder, img_file)
-    img = cv2.imread(img_path)
+# ====== Compiled processing plan ======
+# selected_steps and params are checked once per job and turned into a list of PlanStep objects,
+# each one a function bound to its parameters. Images then only run the plan.
+
+# Turns the raw request value for a step into the arguments its function takes
+def _step_args(step_name, value):
+    if step_name == "resize":
+        return (int(value[0]), int(value[1]))
+    if step_name == "gaussianblur":
+        kernel_size = int(value)
+        return (kernel_size if kernel_size % 2 == 1 else kernel_size + 1,)
+    if step_name in ("colorconvert", "flip"):
+        return (int(value),)
+    return (float(value),)
+
+def _resize_rotate(img, width, height, angle):
+    # Same mapping as cv2.resize (pixel centres) followed by rotate_image, in one warp
+    (h, w) = img.shape[:2]
+    sx, sy = width / w, height / h
+    scale = np.array([[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5], [0, 0, 1]])
+    rotate = cv2.getRotationMatrix2D((width // 2, height // 2), angle, 1.0)
+    return cv2.warpAffine(img, rotate @ scale, (width, height))
+
+class PlanStep:
+    def __init__(self, names, func, args, save=True):
+        self.names = names  # step names this covers, more than one when steps were merged
+        self.func = func
+        self.args = args
+        self.save = save    # write a checkpoint image after this step
+
+    def __call__(self, img):
+        return self.func(img, *self.args)
+
+    def __repr__(self):
+        return f"PlanStep({'+'.join(self.names)}, {self.args}, save={self.save})"
+
+# Back-to-back steps are merged when no checkpoint is needed between them
+def _merge(first, second):
+    names = first.names + second.names
+    if names == ["resize", "rotate"]:
+        return PlanStep(names, _resize_rotate, first.args + second.args, second.save)
+    if first.func is apply_lut and second.func is apply_lut:
+        # Chained tables compose exactly: one pass, same bytes as two
+        return PlanStep(names, apply_lut, (second.args[0][first.args[0]],), second.save)
+    return None
+
+# In save_steps, stands for the last step of the plan whatever its name (a name can repeat)
+FINAL_STEP = "<final>"
+
+def compile_plan(selected_steps, step_map, params, save_steps=None):
+    plan = []
+    step_nums = [str(s).strip() for s in selected_steps if str(s).strip() in step_map]
+    for position, step_num in enumerate(step_nums):
+        step_name, func = step_map[step_num]
+        step_name = step_name.strip().lower()
+        if params.get(step_name) is None:
+            raise ValueError(f"Missing parameter for step '{step_name}'")
+        try:
+            args = _step_args(step_name, params[step_name])
+        except (TypeError, ValueError, IndexError):
+            raise ValueError(f"Invalid parameter for step '{step_name}': {params[step_name]!r}")
+        save = (save_steps is None or step_name in save_steps
+                or (FINAL_STEP in save_steps and position == len(step_nums) - 1))
+        if step_name in POINT_OPS:
+            build_lut, apply = POINT_OPS[step_name]
+            step = PlanStep([step_name], apply, (build_lut(*args),), save)
+        else:
+            step = PlanStep([step_name], func, args, save)
+
+        merged = _merge(plan[-1], step) if plan and not plan[-1].save else None
+        if merged is not None:
+            plan[-1] = merged
+        else:
+            plan.append(step)
+    return plan
 
+# Shape every image has after the plan, or None when it depends on the input (no resize step)
+def plan_output_shape(plan):
+    if isinstance(plan, Augmentation):
+        return plan.output_shape()
+    if not any("resize" in step.names for step in plan):
+        return None
+    probe = np.zeros((64, 64, 3), dtype=np.uint8)
+    for step in plan:
+        probe = step(probe)
+    return probe.shape
+
+
+# ====== Output policy ======
+# Decides which steps get written, in what format, and what happens to the original.
+# keep: "all" writes every step, "final" only the last one, "checkpoints" the steps named in checkpoints.
+# Steps that are not written can then be fused by compile_plan.
+OUTPUT_FORMATS = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION),
+}
+
+class OutputPolicy:
+    def __init__(self, keep="all", checkpoints=None, format="jpg", quality=95, png_compression=3, original=True):
+        if keep not in ("all", "final", "checkpoints"):
+            raise ValueError(f"Unknown output keep mode '{keep}'")
+        if format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{format}'")
+        if not 1 <= int(quality) <= 100:
+            raise ValueError(f"Output quality must be between 1 and 100, got {quality}")
+        if not 0 <= int(png_compression) <= 9:
+            raise ValueError(f"PNG compression must be between 0 and 9, got {png_compression}")
+        self.keep = keep
+        self.checkpoints = {name.strip().lower() for name in checkpoints or []}
+        self.format = format
+        self.extension, flag = OUTPUT_FORMATS[format]
+        self.params = [flag, int(png_compression) if format == "png" else int(quality)]
+        self.original = original
+        self.sinks = []  # dataset exports that also receive every finished image
+
+    # Step names compile_plan should write, None meaning all of them
+    def save_steps(self, selected_steps, step_map):
+        if self.keep == "all":
+            return None
+        if self.keep == "checkpoints":
+            # Sinks need the final image even when it is not a checkpoint
+            return self.checkpoints | {FINAL_STEP} if self.sinks else self.checkpoints
+        return {FINAL_STEP}
+
+    def write(self, path_no_ext, img):
+        path = path_no_ext + self.extension
+        cv2.imwrite(path, img, self.params)
+        return path
+
+    # Raw files are never modified, so a hardlink is enough; copy when linking is not possible
+    def keep_original(self, src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy(src, dst)
+
+
+# ====== Augmentation ======
+# A param can be a range or a set instead of a fixed value, e.g. {"rotate": {"range": [-15, 15]},
+# "flip": {"choice": [0, 1]}}. Every image is decoded once and goes through `variants` plans,
+# each with its own values drawn from a generator seeded by (seed, image, variant), so a job
+# can be repeated exactly. Variant k of 12.jpg is written as 12_v<k>_<steps>.jpg.
+def is_random_param(value):
+    return isinstance(value, dict) and ("range" in value or "choice" in value)
+
+def sample_param(step_name, value, rng):
+    if not is_random_param(value):
+        return value
+    if "choice" in value:
+        if not value["choice"]:
+            raise ValueError(f"Empty choice for step '{step_name}'")
+        return rng.choice(value["choice"])
+    if not isinstance(value["range"], list) or len(value["range"]) != 2:
+        raise ValueError(f"Range for step '{step_name}' must be [low, high], got {value['range']!r}")
+    low, high = value["range"]
+    if step_name in ("gaussianblur", "colorconvert", "flip"):
+        return rng.randint(int(low), int(high))
+    return rng.uniform(float(low), float(high))
+
+class Augmentation:
+    def __init__(self, selected_steps, step_map, params, variants=1, seed=0, save_steps=None):
+        if variants < 1:
+            raise ValueError(f"variants must be at least 1, got {variants}")
+        self.selected_steps = selected_steps
+        self.step_map = step_map
+        self.params = params
+        self.variants = variants
+        self.seed = seed
+        self.save_steps = save_steps
+        self.fixed_resize = not is_random_param(params.get("resize"))
+        try:
+            self.plan_for("probe", 0)  # check every spec once, before any image is touched
+        except (TypeError, KeyError) as e:
+            raise ValueError(f"Invalid augmentation parameters: {e}")
+
+    def plan_for(self, img_file, variant):
+        rng = random.Random(f"{self.seed}:{img_file}:{variant}")
+        params = {name: sample_param(name, value, rng) for name, value in self.params.items()}
+        return compile_plan(self.selected_steps, self.step_map, params, self.save_steps)
+
+    # Reduced decode is only safe when every variant resizes to the same target
+    @property
+    def decode_plan(self):
+        return self.plan_for("probe", 0) if self.fixed_resize else None
+
+    def output_shape(self):
+        return plan_output_shape(self.plan_for("probe", 0)) if self.fixed_resize else None
+
+    # Variants come out one after another, each with the same number of saved steps
+    def transform(self, img_file, img):
+        stem, ext = os.path.splitext(img_file)
+        outputs = []
+        for variant in range(self.variants):
+            outputs.extend(transform_image(f"{stem}_v{variant}{ext}", img, self.plan_for(img_file, variant)))
+        return outputs
+
+# One compiled plan, or an Augmentation when params hold ranges or more than one variant is asked for
+def build_plan(selected_steps, step_map, params, output=None, variants=1, seed=0):
+    output = output or OutputPolicy()
+    save_steps = output.save_steps(selected_steps, step_map)
+    if variants > 1 or any(is_random_param(value) for value in params.values()):
+        return Augmentation(selected_steps, step_map, params, variants, seed, save_steps)
+    return compile_plan(selected_steps, step_map, params, save_steps)
+
+
+# ====== Reduced-resolution decode ======
+# When the plan starts by shrinking the image, a JPEG can be decoded at 1/2, 1/4 or 1/8 size
+# straight from its DCT coefficients. The resize step then scales that smaller image to the exact target.
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Reads width and height from the JPEG frame header without decoding; None for anything else
+def jpeg_size(img_path):
+    with open(img_path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return None
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                continue
+            length = f.read(2)
+            if len(length) < 2:
+                return None
+            if marker[1] in _SOF_MARKERS:
+                header = f.read(5)
+                if len(header) < 5:
+                    return None
+                return int.from_bytes(header[3:5], "big"), int.from_bytes(header[1:3], "big")
+            f.seek(int.from_bytes(length, "big") - 2, os.SEEK_CUR)
+
+def _read_flag(img_path, plan):
+    if not plan or plan[0].names[0] != "resize":
+        return cv2.IMREAD_COLOR
+    size = jpeg_size(img_path)
+    if size is None:
+        return cv2.IMREAD_COLOR
+    # EXIF rotation can swap the sides after decoding, so compare against the shorter source side
+    target = max(plan[0].args[0], plan[0].args[1])
+    for factor, flag in _REDUCED_FLAGS:
+        if min(size) // factor >= target:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+# ====== Helper functions to process single image ======
+# Split into read, transform and write so the staged processor can run each part on its own pool
+def decode_image(img_file, input_folder, plan=None):
+    if isinstance(plan, Augmentation):
+        plan = plan.decode_plan
+    img_path = os.path.join(input_folder, img_file)
+    img = cv2.imread(img_path, _read_flag(img_path, plan))
     if img is None:
         print(f"❌ Failed to read {img_file}")
-        return
+    return img
 
+# Returns [(name without extension, image)] for every step the plan saves
+def transform_image(img_file, img, plan):
+    if isinstance(plan, Augmentation):
+        return plan.transform(img_file, img)
     filename_no_ext = os.path.splitext(img_file)[0]
-
-    # ✅ Copy original
-    shutil.copy(img_path, os.path.join(output_folder, f"{filename_no_ext}_original.jpg"))
-
+    outputs = []
     suffix_list = []
     processed_img = img
-    #print(selected_steps)
-  
-
-   
-    for step_num in selected_steps:
-        thread_id = threading.get_ident()  # ✅ Get thread ID
-        thread_name = threading.current_thread().name  # ✅ Or thread name
-        print(f"🧵 Thread {thread_name} (ID {thread_id}) is processing {img_file}")
-        print("step num ==",step_num)
-        
-    
-
-        if step_num not in step_map:
-            continue
-        step_name, func = step_map[step_num]
-        step_name = step_name.strip().lower()
-        suffix_list.append(step_name)
-
-        # Apply step
-        if step_name == "resize":
-            processed_img = func(processed_img, params['resize'][0], params['resize'][1])
-        elif step_name == "colorconvert":
-            processed_img = func(processed_img, params['colorconvert'])
-        elif step_name == "gaussianblur":
-            processed_img = func(processed_img, params['gaussianblur'])
-        elif step_name == "rotate":
-            processed_img = func(processed_img, params['rotate'])
-        elif step_name == "brightness":
-            processed_img = func(processed_img, params['brightness'])
-        elif step_name == "contrast":
-            processed_img = func(processed_img, params['contrast'])
-        elif step_name == "saturation":
-            processed_img = func(processed_img, params['saturation'])
-        elif step_name == "flip":
-            processed_img = func(processed_img, params['flip'])
+    for step in plan:
+        processed_img = step(processed_img)
+        suffix_list.extend(step.names)
 
         # Save intermediate step image
-        step_suffix = "_".join(suffix_list)
-        step_filename = f"{filename_no_ext}_{step_suffix}.jpg"
-        step_save_path = os.path.join(output_folder, step_filename)
-        cv2.imwrite(step_save_path, processed_img)
+        if step.save:
+            step_suffix = "_".join(suffix_list)
+            outputs.append((f"{filename_no_ext}_{step_suffix}", processed_img))
+    return outputs
+
+def write_outputs(img_file, outputs, input_folder, output_folder, output=None):
+    output = output or OutputPolicy()
+    filename_no_ext, ext = os.path.splitext(img_file)
+
+    written = []
+    if output.original:
+        original_path = os.path.join(output_folder, f"{filename_no_ext}_original{ext.lower()}")
+        output.keep_original(os.path.join(input_folder, img_file), original_path)
+        written.append(original_path)
+
+    for step_name, processed_img in outputs:
+        written.append(output.write(os.path.join(output_folder, step_name), processed_img))
+    for sink in output.sinks:
+        sink.add(img_file, outputs, written)
+
+# False when the image could not be read
+def process_single_image(img_file, input_folder, output_folder, plan, output=None):
+    img = decode_image(img_file, input_folder, plan)
+    if img is None:
+        return False
+    write_outputs(img_file, transform_image(img_file, img, plan), input_folder, output_folder, output)
+    return True
+
+
+# ====== Staged processor ======
+# Reading, transforming and writing each get their own threads, joined by bounded queues so
+# only a few decoded images are held in memory at once. A slow disk then only holds up the
+# read or write stage instead of the threads doing the pixel work.
+_DONE = object()
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.images = 0
+        self.busy = 0.0  # summed over the stage's threads
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.images += 1
+            self.busy += seconds
+
+    def to_dict(self, workers):
+        per_second = self.images * workers / self.busy if self.busy else 0.0
+        return {"images": self.images, "busy_seconds": round(self.busy, 2), "images_per_second": round(per_second, 1)}
+
+# image_files is a list, or a queue.Queue that is filled while the stages run and closed with None
+# (the pipeline hands over files as they finish downloading). on_written(img_file) is called
+# after each image's outputs are on disk.
+def run_stages(image_files, input_folder, output_folder, plan, output=None, job=None, progress=None,
+               read_workers=PROCESS_READ_WORKERS, transform_workers=PROCESS_TRANSFORM_WORKERS,
+               write_workers=PROCESS_WRITE_WORKERS, queue_size=PROCESS_QUEUE_SIZE, on_written=None):
+    file_queue = queue.Queue()
+    decoded_queue = queue.Queue(maxsize=queue_size)
+    encoded_queue = queue.Queue(maxsize=queue_size)
+    stats = {name: StageStats(name) for name in ("read", "transform", "write")}
+    workers = {"read": read_workers, "transform": transform_workers, "write": write_workers}
+
+    def feed():
+        while True:
+            img_file = image_files.get()
+            if img_file is None:
+                break
+            file_queue.put((img_file, None))
+        for _ in range(read_workers):
+            file_queue.put(_DONE)
+
+    if isinstance(image_files, queue.Queue):
+        feeder = threading.Thread(target=feed, name="read-feed", daemon=True)
+        feeder.start()
+    else:
+        feeder = None
+        for img_file in image_files:
+            file_queue.put((img_file, None))
+        for _ in range(read_workers):
+            file_queue.put(_DONE)
+
+    def cancelled():
+        return job is not None and job.is_cancelled()
+
+    def failed(img_file, e):
+        print(f"❌ Failed to process {img_file}: {e}")
+        if job:
+            job.increment("failed")
+        if progress is not None:
+            progress.update(1)
+
+    # Each stage keeps draining its input after a cancel so the one before it never blocks
+    def stage(name, source, sink, work):
+        while True:
+            item = source.get()
+            if item is _DONE:
+                break
+            img_file, data = item
+            if cancelled():
+                continue
+            started = time.perf_counter()
+            try:
+                result = work(img_file, data)
+            except Exception as e:
+                failed(img_file, e)
+                continue
+            stats[name].record(time.perf_counter() - started)
+            if result is None:
+                failed(img_file, "unreadable image")
+            elif sink is not None:
+                sink.put((img_file, result))
+
+    def read(img_file, _):
+        return decode_image(img_file, input_folder, plan)
+
+    def transform(img_file, img):
+        return transform_image(img_file, img, plan)
+
+    def write(img_file, outputs):
+        write_outputs(img_file, outputs, input_folder, output_folder, output)
+        if job:
+            job.increment("processed")
+        if progress is not None:
+            progress.update(1)
+        if on_written:
+            on_written(img_file)
+        return True
+
+    def start(name, source, sink, work, n):
+        threads = [threading.Thread(target=stage, args=(name, source, sink, work), name=f"{name}-{i}", daemon=True)
+                   for i in range(n)]
+        for t in threads:
+            t.start()
+        return threads
+
+    readers = start("read", file_queue, decoded_queue, read, read_workers)
+    transformers = start("transform", decoded_queue, encoded_queue, transform, transform_workers)
+    writers = start("write", encoded_queue, None, write, write_workers)
+
+    # Shut the stages down in order once the one before them has finished
+    if feeder is not None:
+        feeder.join()
+    for t in readers:
+        t.join()
+    for _ in transformers:
+        decoded_queue.put(_DONE)
+    for t in transformers:
+        t.join()
+    for _ in writers:
+        encoded_queue.put(_DONE)
+    for t in writers:
+        t.join()
+
+    report = {name: stats[name].to_dict(workers[name]) for name in stats}
+    bottleneck = min(report, key=lambda name: report[name]["images_per_second"] or float("inf"))
+    print("📊 Stage throughput: " + ", ".join(
+        f"{name} {r['images_per_second']}/s ({workers[name]} threads)" for name, r in report.items()
+    ) + f" - bottleneck: {bottleneck}")
+    if job:
+        job.report(stages=report, bottleneck=bottleneck)
+    return report
+
+
+# ====== Vectorized batch executor ======
+# Once a resize has run, every image in a batch has the same shape and can be stacked into one
+# N x H x W x C array. Per-pixel steps then run as a single call over the whole stack; steps
+# that look at neighbouring pixels, and batches whose shapes differ, still run image by image.
+
+# Per-pixel OpenCV calls see the stack as one tall (N*H) x W image
+def _batch_pixels(func):
+    def run(batch, *args):
+        n, h = batch.shape[:2]
+        result = func(batch.reshape(n * h, *batch.shape[2:]), *args)
+        return result.reshape(n, h, *result.shape[1:])
+    return run
+
+def _batch_flip(batch, flip_code):
+    # cv2.flip codes: 0 flips rows, any positive code flips columns, any negative one both
+    axes = (1,) if flip_code == 0 else (2,) if flip_code > 0 else (1, 2)
+    return np.ascontiguousarray(np.flip(batch, axes))
+
+BATCH_OPS = {
+    apply_lut: _batch_pixels(apply_lut),
+    apply_saturation_lut: _batch_pixels(apply_saturation_lut),
+    flip_image: _batch_flip,
+}
+
+def transform_batch(img_files, images, plan):
+    if isinstance(plan, Augmentation):
+        # Every image gets its own random values, nothing to share across the batch
+        return [plan.transform(f, img) for f, img in zip(img_files, images)]
+    outputs = [[] for _ in images]
+    stems = [os.path.splitext(f)[0] for f in img_files]
+    suffix_list = []
+    current = images
+    for step in plan:
+        batch_op = BATCH_OPS.get(step.func)
+        if batch_op is not None and len(current) > 1 and len({img.shape for img in current}) == 1:
+            if not isinstance(current, np.ndarray):
+                current = np.stack(current)
+            current = batch_op(current, *step.args)
+        else:
+            current = [step(img) for img in current]
+        suffix_list.extend(step.names)
+
+        if step.save:
+            step_suffix = "_".join(suffix_list)
+            for i, img in enumerate(current):
+                outputs[i].append((f"{stems[i]}_{step_suffix}", img))
+    return outputs
+
+# Returns how many images in the batch failed
+def _process_batch(img_files, input_folder, output_folder, plan, output, pool):
+    images = list(pool.map(lambda f: decode_image(f, input_folder, plan), img_files))
+    readable = [(f, img) for f, img in zip(img_files, images) if img is not None]
+    failed = len(img_files) - len(readable)
+    if not readable:
+        return failed
+    files = [f for f, _ in readable]
+    try:
+        outputs = transform_batch(files, [img for _, img in readable], plan)
+    except Exception as e:
+        print(f"⚠️ Batch failed, processing its images one by one: {e}")
+        results = [_process_one(f, input_folder, output_folder, plan, output) for f in files]
+        return failed + results.count(False)
+
+    def write(item):
+        try:
+            write_outputs(item[0], item[1], input_folder, output_folder, output)
+            return True
+        except Exception as e:
+            print(f"❌ Failed to write {item[0]}: {e}")
+            return False
+    return failed + list(pool.map(write, zip(files, outputs))).count(False)
+
+def run_batches(image_files, input_folder, output_folder, plan, output=None, job=None, progress=None,
+                batch_size=PROCESS_BATCH_SIZE, io_workers=PROCESS_READ_WORKERS):
+    with ThreadPoolExecutor(max_workers=io_workers) as pool:
+        for i in range(0, len(image_files), batch_size):
+            if job:
+                job.check_cancelled()
+            batch = image_files[i:i + batch_size]
+            failed = _process_batch(batch, input_folder, output_folder, plan, output, pool)
+            if progress is not None:
+                progress.update(len(batch))
+            if job:
+                job.increment("processed", len(batch) - failed)
+                if failed:
+                    job.increment("failed", failed)
+
+
+# ====== Execution backends ======
+# Workers get file paths, never pixel data, so nothing large is pickled between processes.
+def _init_worker():
+    cv2.setNumThreads(1)  # the pool already uses every core, OpenCV's own threads would oversubscribe
+
+def _process_one(img_file, input_folder, output_folder, plan, output):
+    try:
+        return process_single_image(img_file, input_folder, output_folder, plan, output)
+    except Exception as e:
+        print(f"❌ Failed to process {img_file}: {e}")
+        return False
+
+# Returns how many images in the chunk failed
+def _process_chunk(img_files, input_folder, output_folder, plan, output, threads=1):
+    if threads <= 1:
+        results = [_process_one(f, input_folder, output_folder, plan, output) for f in img_files]
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(lambda f: _process_one(f, input_folder, output_folder, plan, output), img_files))
+    return results.count(False)
+
+# Picks (processes, threads per process) from the core count and how big the images are
+def auto_workers(image_files, input_folder, backend):
+    cores = os.cpu_count() or 4
+    sample = image_files[:20]
+    avg_file_size = sum(os.path.getsize(os.path.join(input_folder, f)) for f in sample) / max(1, len(sample))
+
+    # A decoded JPEG is roughly 10x its file size, and a few copies exist while steps run
+    per_image_memory = max(1, avg_file_size * 10 * 3)
+    memory_cap = max(1, int(PROCESS_MEMORY_BUDGET // per_image_memory))
+
+    if backend == "threads":
+        # cv2 releases the GIL, but the Python glue between calls does not
+        return 1, max(1, min(cores * 2, 32, memory_cap, len(image_files) or 1))
+    if backend == "processes":
+        return max(1, min(cores, memory_cap, len(image_files) or 1)), 1
+    # hybrid: one process per core, extra threads to hide disk reads and writes on small images
+    processes = max(1, min(cores, memory_cap, len(image_files) or 1))
+    threads = 4 if avg_file_size < 512 * 1024 else 2
+    threads = max(1, min(threads, memory_cap // processes))
+    return processes, threads
 
 
 # ====== Main core processor ======
-def coreProcessor(input_folder, selected_steps, step_map, params):
-    output_folder = "./processedimg"
+def coreProcessor(input_folder, selected_steps, step_map, params, job=None, output_folder="./processedimg",
+                  backend=PROCESS_BACKEND, workers=PROCESS_WORKERS, output=None, variants=1, seed=0):
     os.makedirs(output_folder, exist_ok=True)
-    image_files = [f for f in os.listdir(input_folder) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    image_files = sorted(f for f in os.listdir(input_folder) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+
+    output = output or OutputPolicy()
+    plan = build_plan(selected_steps, step_map, params, output, variants, seed)
+
+    if output.sinks and backend in ("processes", "hybrid"):
+        # Sinks write into this process's memory, worker processes cannot reach them
+        print(f"⚠️ {backend} backend cannot feed dataset exports, using staged")
+        backend = "staged"
+
+    if backend in ("staged", "vectorized"):
+        if job:
+            job.report(processed=0, to_process=len(image_files))
+        with tqdm(total=len(image_files)) as progress:
+            if backend == "staged":
+                print(f"\n🔄 Processing {len(image_files)} images in read -> transform -> write stages...")
+                run_stages(image_files, input_folder, output_folder, plan, output, job, progress,
+                           transform_workers=workers or PROCESS_TRANSFORM_WORKERS)
+            else:
+                print(f"\n🔄 Processing {len(image_files)} images in batches of {PROCESS_BATCH_SIZE}...")
+                run_batches(image_files, input_folder, output_folder, plan, output, job, progress)
+        if job:
+            job.check_cancelled()
+        print(f"\n✅ Done! All processed images (including originals) are saved in: {output_folder}")
+        return output_folder
+
+    processes, threads = auto_workers(image_files, input_folder, backend)
+    if workers:
+        if backend == "threads":
+            threads = workers
+        else:
+            processes = workers
+
+    print(f"\n🔄 Processing {len(image_files)} images with {backend} backend ({processes} processes x {threads} threads)...")
+    if job:
+        job.report(processed=0, to_process=len(image_files))
 
-    print(f"\n🔄 Processing {len(image_files)} images...")
+    if backend == "threads":
+        executor = ThreadPoolExecutor(max_workers=threads)
+        chunks = [[f] for f in image_files]
+        threads = 1
+    else:
+        executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_worker)
+        # Small chunks amortise the inter-process call but keep progress and cancellation responsive
+        chunk_size = max(1, min(16, len(image_files) // (processes * 4) or 1))
+        chunks = [image_files[i:i + chunk_size] for i in range(0, len(image_files), chunk_size)]
 
-    max_workers = min(8, os.cpu_count() or 4)  # Use up to 8 threads or CPU count
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(process_single_image, img_file, input_folder, output_folder, selected_steps, step_map, params)
-            for img_file in image_files
-        ]
+    with executor:
+        futures = {
+            executor.submit(_process_chunk, chunk, input_folder, output_folder, plan, output, threads): len(chunk)
+            for chunk in chunks
+        }
 
-        for f in tqdm(as_completed(futures), total=len(futures)):
-            pass  # Progress bar updates
+        with tqdm(total=len(image_files)) as progress:
+            for f in as_completed(futures):
+                done = futures[f]
+                progress.update(done)
+                failed = f.result()
+                if job:
+                    job.increment("processed", done - failed)
+                    if failed:
+                        job.increment("failed", failed)
+                    if job.is_cancelled():
+                        for pending in futures:
+                            pending.cancel()
+                        job.check_cancelled()
 
     print(f"\n✅ Done! All processed images (including originals) are saved in: {output_folder}")
     return output_folder
@@ -12,7 +12,8 @@ from scraperMain import imageScraper
 #Import functions from processor.py
 from newProcessor import (
    resize_image, color_convert, gaussian_blur, rotate_image,
-   adjust_brightness, adjust_contrast, adjust_saturation, flip_image, coreProcessor )
+   adjust_brightness, adjust_contrast, adjust_saturation, flip_image, coreProcessor, OutputPolicy,
+   build_plan, plan_output_shape )
 # def delete(path):
 #     try:
 #         time.sleep(300)  # wait for 5 minutes (300 seconds)
@@ -126,22 +127,34 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Literal
 import uvicorn
 from scraperMain import imageScraper
 import shutil
 import threading
 import time
 import os
-import zipfile
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from config import EXPORT_SHARD_SIZE, JOB_ENGINE, JOB_WORKERS, PUBLIC_URL, WORKSPACE_TTL_SECONDS
+from pipeline import run_pipeline
+from jobs import JobManager, QueueFull
+from driverPool import driver_pool
+from downloader import downloader
+from workspace import Workspace
+from zipStream import create_zip_from_folder, iter_zip
+from datasetExport import NpyDataset, TarShards
+from scraperMain import MANIFEST_NAME, load_manifest
+from resultCache import canonical_key, result_cache
+from singleFlight import scrape_flights
+from rateLimit import rate_limiter
+from workspace import is_safe_name
 
 # Function to delete files/folders after a delay
-def delete(path):
+def delete(path, delay=WORKSPACE_TTL_SECONDS):
     try:
-        time.sleep(300)  # wait for 5 minutes (300 seconds)
+        time.sleep(delay)  # wait for 5 minutes (300 seconds) by default
 
         if os.path.isfile(path):
             os.remove(path)
@@ -167,18 +180,20 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-TEMP_FOLDER = "./temp_files"
-
-# Create a folder for temp files if it doesn't exist
-if not os.path.exists(TEMP_FOLDER):
-    os.makedirs(TEMP_FOLDER)
-
-# Function to zip a folder
-def create_zip_from_folder(folder_path, zip_filename):
-    with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                zipf.write(os.path.join(root, file), os.path.relpath(os.path.join(root, file), folder_path))
+# Which processed files end up in the archive, see OutputPolicy.
+# Checked here so bad values get a 422 instead of a job that fails once it runs.
+class OutputOptions(BaseModel):
+    keep: Literal["all", "final", "checkpoints"] = "all"
+    checkpoints: List[str] = []  # step names to write when keep is "checkpoints"
+    format: Literal["jpg", "webp", "png"] = "jpg"
+    quality: int = Field(95, ge=1, le=100)  # jpg / webp
+    png_compression: int = Field(3, ge=0, le=9)
+    original: bool = True  # include the downloaded original
+
+# Several randomised variants per image, see Augmentation
+class AugmentOptions(BaseModel):
+    variants: int = 1
+    seed: int = 0
 
 # Define request body structure
 class ProcessRequest(BaseModel):
@@ -186,6 +201,11 @@ class ProcessRequest(BaseModel):
     num_images: int
     selected_steps: List[str]
     params: Dict[str, Any]
+    archive: str = "stream"  # "stream": zip on the fly at download time, "file": build the zip on disk
+    output: OutputOptions = OutputOptions()
+    exports: List[str] = []  # extra dataset files next to the zip: "npy", "tar"
+    augment: AugmentOptions = AugmentOptions()
+    refresh: bool = False  # skip the result cache and run the job again
 
 # Map step numbers to function names and functions
 step_map = {
@@ -199,43 +219,289 @@ step_map = {
     "8": ("flip", flip_image),
 }
 
-@app.post("/process")
-async def process_images(request: ProcessRequest):
-    query = request.query
-    num_images = request.num_images
-    selected_steps = request.selected_steps
-    params = request.params
-    print(selected_steps)
-    print(params)
-    # Scrape images
-    folder = imageScraper(query, num_images)
-
-    # Preprocess images
-    op_folder = coreProcessor(folder, selected_steps, step_map, params)
-
-    # Zip the output folder
-    zip_filename = f"{TEMP_FOLDER}/{os.path.basename(op_folder)}.zip"
-    create_zip_from_folder(op_folder, zip_filename)
-
-    # Schedule deletion after 5 minutes
-    threading.Thread(target=delete, args=(folder,), daemon=True).start()
-    threading.Thread(target=delete, args=(op_folder,), daemon=True).start()
-    threading.Thread(target=delete, args=(zip_filename,), daemon=True).start()
+# Dataset files are written while images are processed and served from the archive folder
+def create_exports(job, workspace, output, raw_folder):
+    request = job.request
+    exports = {}
+    for name in request.exports:
+        if name == "npy":
+            augment = request.augment
+            shape = plan_output_shape(build_plan(request.selected_steps, step_map, request.params,
+                                                 variants=augment.variants, seed=augment.seed))
+            if shape is None:
+                raise ValueError("The npy export needs a fixed-size resize step so every image has the same shape")
+            exports[name] = NpyDataset(workspace.archive_file(f"{job.id}.npy"), request.num_images * augment.variants,
+                                       shape, augment.variants)
+        elif name == "tar":
+            exports[name] = TarShards(workspace.archive, job.id, EXPORT_SHARD_SIZE,
+                                      manifest_path=os.path.join(raw_folder, MANIFEST_NAME),
+                                      on_shard=lambda path: publish_export(job, path))
+        else:
+            raise ValueError(f"Unknown export '{name}'")
+    output.sinks.extend(exports.values())
+    return exports
+
+def publish_export(job, path):
+    filename = os.path.basename(path)
+    job.publish(filename, f"{PUBLIC_URL}/download/{job.id}/{filename}")
+
+def finish_exports(job, exports, raw_folder):
+    manifest = load_manifest(raw_folder)
+    for export in exports.values():
+        for path in export.finish(manifest):
+            publish_export(job, path)
+
+# Everything that changes the archive's content; how it is delivered does not matter
+def request_cache_key(request):
+    return canonical_key({
+        "query": " ".join(request.query.lower().split()),
+        "num_images": request.num_images,
+        "selected_steps": [str(s).strip() for s in request.selected_steps],
+        "params": request.params,
+        "output": vars(request.output),
+        "augment": vars(request.augment),
+        "exports": sorted(request.exports),
+    })
+
+# Jobs that would download exactly the same images share one scrape
+def scrape_key(request):
+    return f"{' '.join(request.query.lower().split())}|{request.num_images}"
+
+# Dataset exports live in the job's workspace, only the zip is cached
+def is_cacheable(request):
+    return not request.exports
+
+# A job that came up short (blocked sources, broken images) must not be served for a whole TTL
+def is_complete(job):
+    progress = job.progress
+    return progress.get("processed", 0) >= job.request.num_images and not progress.get("failed", 0)
+
+def cache_result(key, workspace, zip_filename):
+    try:
+        zip_path = workspace.archive_file(zip_filename)
+        if os.path.exists(zip_path):
+            result_cache.store_file(key, zip_path)
+        else:
+            result_cache.store_folder(key, workspace.processed)
+    except Exception as e:
+        print(f"❌ Could not cache result {key[:12]}: {e}")
+
+# Runs in a background worker thread, never on the event loop
+def run_job(job):
+    request = job.request
+    print(request.selected_steps)
+    print(request.params)
+    options = request.output
+    output = OutputPolicy(options.keep, options.checkpoints, options.format, options.quality,
+                          options.png_compression, options.original)
+    process_options = dict(output=output, variants=request.augment.variants, seed=request.augment.seed)
+    workspace = Workspace(job.id).create()
+    flight, leader = scrape_flights.join(scrape_key(request))
+    try:
+        job.report(requested=request.num_images)
+
+        # Another job is already fetching these images: wait for it instead of scraping again
+        raw_folder = flight.folder
+        shared = False
+        if not leader:
+            job.set_stage("waiting for shared scrape")
+            shared = scrape_flights.wait(flight, job)
+            if not shared:
+                raw_folder = workspace.raw  # that job failed, fetch our own copy
+        job.report(shared_scrape=shared)
+
+        exports = create_exports(job, workspace, output, raw_folder)
+        if shared:
+            job.set_stage("processing")
+            coreProcessor(raw_folder, request.selected_steps, step_map, request.params, job,
+                          output_folder=workspace.processed, **process_options)
+        elif JOB_ENGINE == "pipeline":
+            # Scrape, download and preprocess at the same time
+            job.set_stage("pipeline")
+            on_downloaded = (lambda: scrape_flights.finish(flight, True)) if leader else None
+            run_pipeline(request.query, request.num_images, raw_folder, workspace.processed,
+                         request.selected_steps, step_map, request.params, job,
+                         on_downloaded=on_downloaded, **process_options)
+        else:
+            # Scrape images
+            job.set_stage("scraping")
+            imageScraper(request.query, request.num_images, job, dest_folder=raw_folder)
+            if leader:
+                scrape_flights.finish(flight, True)
+
+            # Preprocess images
+            job.set_stage("processing")
+            coreProcessor(raw_folder, request.selected_steps, step_map, request.params, job,
+                          output_folder=workspace.processed, **process_options)
+
+        finish_exports(job, exports, raw_folder)
+
+        # Zip the output folder, streamed archives are built while they are downloaded
+        zip_filename = f"{job.id}.zip"
+        if request.archive == "file":
+            job.set_stage("zipping")
+            create_zip_from_folder(workspace.processed, workspace.archive_file(zip_filename))
+    except BaseException:
+        # Nothing to download from a failed or cancelled job
+        workspace.cleanup()
+        raise
+    finally:
+        if leader:
+            scrape_flights.finish(flight, False)  # no-op when the scrape already succeeded
+        scrape_flights.leave(flight)
+
+    if is_cacheable(request) and is_complete(job):
+        threading.Thread(target=cache_result, args=(request_cache_key(request), workspace, zip_filename),
+                         daemon=True).start()
+
+    # Schedule deletion of the whole workspace after 5 minutes
+    threading.Thread(target=delete, args=(workspace.root,), daemon=True).start()
 
     # Generate the download link
-    download_link = f"http://localhost:4000/download/{os.path.basename(zip_filename)}"
+    download_link = f"{PUBLIC_URL}/download/{job.id}/{zip_filename}"
     print(download_link)
-    return {"message": "Processing done!", "download_link": download_link}
+    job.result["download_link"] = download_link
+
+job_manager = JobManager(run_job, max_workers=JOB_WORKERS)
 
-@app.get("/download/{filename}")
-async def download_zip(filename: str):
-    zip_path = os.path.join(TEMP_FOLDER, filename)
+# Warm the browsers in the background so the server accepts requests right away
+def warm_driver_pool():
+    try:
+        driver_pool.start()
+    except Exception as e:
+        print(f"❌ Driver pool warm-up failed, browsers will start on demand: {e}")
+
+@app.on_event("startup")
+def start_driver_pool():
+    threading.Thread(target=warm_driver_pool, daemon=True).start()
+
+# Only the server process cleans the cache folder, never a worker importing this module
+@app.on_event("startup")
+def start_result_cache():
+    result_cache.start()
+
+@app.on_event("shutdown")
+def stop_jobs():
+    job_manager.shutdown()
+    driver_pool.close()
+    downloader.close()
+
+# Overloaded servers tell the client when to come back instead of queueing without bound
+def too_busy(detail, retry_after):
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+@app.post("/process")
+async def process_images(request: ProcessRequest, http_request: Request):
+    client = http_request.client.host if http_request.client else "unknown"
+    retry_after = rate_limiter.acquire(client)
+    if retry_after is not None:
+        raise too_busy("Too many requests from this client", retry_after)
+
+    if is_cacheable(request) and not request.refresh:
+        key = request_cache_key(request)
+        if result_cache.lookup(key):
+            job = job_manager.add_finished(request, {
+                "download_link": f"{PUBLIC_URL}/cached/{key}.zip",
+                "cached": True,
+            })
+            return {
+                "message": "Cached result",
+                "job_id": job.id,
+                "status_url": f"{PUBLIC_URL}/jobs/{job.id}",
+                "download_link": job.result["download_link"],
+            }
+    try:
+        job, attached = job_manager.submit(request, key=request_cache_key(request))
+    except QueueFull as e:
+        raise too_busy(f"Server is busy: {e.reason}", e.retry_after)
+    return {
+        "message": "Attached to running job" if attached else "Job queued",
+        "job_id": job.id,
+        "status_url": f"{PUBLIC_URL}/jobs/{job.id}",
+        "queue_position": job_manager.queue_position(job),
+    }
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    status = job.to_dict()
+    status["queue_position"] = job_manager.queue_position(job)
+    return status
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/download/{job_id}/{filename}")
+async def download_zip(job_id: str, filename: str):
+    try:
+        zip_path = Workspace(job_id).archive_file(filename)
+    except ValueError:
+        zip_path = None
 
     # Ensure the file exists
-    if os.path.exists(zip_path):
-        return FileResponse(zip_path, media_type='application/zip', filename=filename)
-    else:
+    if zip_path and os.path.exists(zip_path):
+        media_type = 'application/zip' if filename.endswith(".zip") else 'application/octet-stream'
+        return FileResponse(zip_path, media_type=media_type, filename=filename)
+
+    # Streamed archive: zip the finished job's output folder while sending it
+    job = job_manager.get(job_id)
+    if zip_path and filename == f"{job_id}.zip" and job and job.status == "done":
+        workspace = Workspace(job_id)
+        if os.path.isdir(workspace.processed):
+            return StreamingResponse(
+                iter_zip(workspace.processed),
+                media_type='application/zip',
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+            )
+    raise HTTPException(status_code=404, detail="File not found")
+
+@app.get("/cached/{filename}")
+async def download_cached(filename: str):
+    key = filename[:-len(".zip")] if filename.endswith(".zip") else ""
+    zip_path = result_cache.path(key) if key and is_safe_name(key) else None
+    if not zip_path or not os.path.exists(zip_path):
         raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(zip_path, media_type='application/zip', filename=filename)
+
+@app.get("/stats")
+async def cache_stats():
+    return {
+        "jobs": job_manager.stats(),
+        "browsers": driver_pool.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "result_cache": result_cache.stats(),
+        "download_cache": downloader.cache.stats() if downloader.cache else None,
+    }
+
+# Prometheus text format, for the autoscaler
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    jobs = job_manager.stats()
+    browsers = driver_pool.stats()
+    lines = [
+        "# TYPE scraper_jobs_running gauge",
+        f"scraper_jobs_running {jobs['running']}",
+        "# TYPE scraper_jobs_queued gauge",
+        f"scraper_jobs_queued {jobs['queued']}",
+        "# TYPE scraper_images_in_flight gauge",
+        f"scraper_images_in_flight {jobs['images_in_flight']}",
+        "# TYPE scraper_job_workers gauge",
+        f"scraper_job_workers {jobs['workers']}",
+        "# TYPE scraper_browsers_in_use gauge",
+        f"scraper_browsers_in_use {browsers['in_use']}",
+        "# TYPE scraper_browsers_limit gauge",
+        f"scraper_browsers_limit {browsers['limit']}",
+        "# TYPE scraper_rejected_total counter",
+        f'scraper_rejected_total{{reason="rate_limit"}} {rate_limiter.stats()["rejected"]}',
+    ]
+    lines += [f'scraper_rejected_total{{reason="{reason}"}} {count}' for reason, count in jobs["rejected"].items()]
+    return "\n".join(lines) + "\n"
 
 @app.get("/")
 async def say():
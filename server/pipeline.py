@@ -0,0 +1,108 @@
+import os
+import queue
+import threading
+import time
+from itertools import count
+
+from config import PIPELINE_DOWNLOAD_WORKERS, PIPELINE_PROCESS_WORKERS, PIPELINE_QUEUE_SIZE
+from newProcessor import OutputPolicy, build_plan, run_stages
+from quota import QuotaLedger
+from scraperMain import SOURCES, discover_source, download_claimed
+
+_DONE = object()
+
+
+# ===== Scrape -> download -> process pipeline =====
+# Sources push claimed URLs into a bounded queue that download workers read from right away,
+# and finished files go through a second bounded queue to the staged processor (read ->
+# transform -> write, see run_stages) with PIPELINE_PROCESS_WORKERS transform threads. All
+# stages run at the same time, so the first processed image shows up within seconds.
+def run_pipeline(query, total_images, raw_folder, output_folder, selected_steps, step_map, params, job=None,
+                 download_workers=PIPELINE_DOWNLOAD_WORKERS, process_workers=PIPELINE_PROCESS_WORKERS,
+                 queue_size=PIPELINE_QUEUE_SIZE, output=None, variants=1, seed=0, on_downloaded=None):
+    os.makedirs(raw_folder, exist_ok=True)
+    os.makedirs(output_folder, exist_ok=True)
+
+    output = output or OutputPolicy()
+    plan = build_plan(selected_steps, step_map, params, output, variants, seed)
+    ledger = QuotaLedger(total_images, list(SOURCES))
+    url_queue = queue.Queue(maxsize=queue_size)
+    file_queue = queue.Queue(maxsize=queue_size)
+    image_numbers = count(1)
+    started = time.time()
+    first_image = []
+
+    def cancelled():
+        return job is not None and job.is_cancelled()
+
+    def handle_image(source, image):
+        url_queue.put((source, image))
+
+    # Download workers keep draining the queue until told to stop, so producers never block forever
+    def download_worker():
+        while True:
+            item = url_queue.get()
+            if item is _DONE:
+                break
+            source, image = item
+            filename = download_claimed(source, image, ledger, raw_folder, image_numbers, job)
+            if filename:
+                file_queue.put(filename)
+
+    def on_written(img_file):
+        if not first_image:
+            first_image.append(time.time() - started)
+            print(f"⏱️ First image processed after {first_image[0]:.1f}s")
+            if job:
+                job.report(first_image_seconds=round(first_image[0], 2))
+
+    def process():
+        run_stages(file_queue, raw_folder, output_folder, plan, output, job,
+                   transform_workers=process_workers, on_written=on_written)
+
+    def start(target, name, n):
+        threads = [threading.Thread(target=target, name=f"{name}-{i}", daemon=True) for i in range(n)]
+        for t in threads:
+            t.start()
+        return threads
+
+    if job:
+        job.report(downloaded=0, processed=0)
+    print(f"\n🚀 Pipeline: {len(SOURCES)} sources -> {download_workers} downloaders -> {process_workers} processors")
+
+    errors = []
+
+    def discover(source):
+        try:
+            discover_source(source, query, ledger, handle_image, job)
+        except Exception as e:
+            errors.append(e)
+
+    producers = [threading.Thread(target=discover, args=(source,), name=f"source-{source}", daemon=True)
+                 for source in SOURCES]
+    for t in producers:
+        t.start()
+    downloaders = start(download_worker, "download", download_workers)
+    processor = threading.Thread(target=process, name="process", daemon=True)
+    processor.start()
+
+    # Shut the stages down in order once the one before them has finished
+    for t in producers:
+        t.join()
+    for _ in downloaders:
+        url_queue.put(_DONE)
+    for t in downloaders:
+        t.join()
+    # Everything is on disk, other jobs sharing raw_folder can start processing
+    if on_downloaded and not cancelled() and not errors:
+        on_downloaded()
+    file_queue.put(None)
+    processor.join()
+
+    if job:
+        job.check_cancelled()
+    if errors:
+        raise errors[0]
+
+    print(f"\n✅ Pipeline done in {time.time() - started:.1f}s: {ledger.succeeded} images downloaded and processed into {output_folder}")
+    return output_folder
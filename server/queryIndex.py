@@ -0,0 +1,101 @@
+import json
+import sqlite3
+import threading
+import time
+
+from config import QUERY_INDEX_PATH, QUERY_INDEX_RECHECK_SECONDS
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+# Where a source stopped paginating: a Picjumbo page number, the Wikimedia API "continue" dict
+# or a Yahoo result offset. Sources advance it as soon as they have a page, before yielding the
+# page's images, and set exhausted when the search has no more results.
+class Cursor:
+    def __init__(self, value=None, exhausted=False):
+        self.value = value
+        self.exhausted = exhausted
+        self.page = []  # images of the last page, indexed even if the job stops halfway through it
+
+    def advance(self, value, page):
+        self.value = value
+        self.page = page
+
+
+# ===== Persistent per-query URL index =====
+# Remembers every image each source found for a normalised query, in discovery order, and the
+# cursor it reached. A later job for the same query replays the known URLs first and only
+# asks the source for more, starting from that cursor.
+class QueryIndex:
+    def __init__(self, path=QUERY_INDEX_PATH, recheck_seconds=QUERY_INDEX_RECHECK_SECONDS):
+        self.path = path
+        self.recheck_seconds = recheck_seconds
+        self._conn = None
+        self._lock = threading.Lock()
+
+    # Opened on first use, so importing the scraper creates no files. Callers hold the lock.
+    @property
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS images (
+                    query TEXT NOT NULL, source TEXT NOT NULL, url TEXT NOT NULL, image TEXT NOT NULL,
+                    PRIMARY KEY (query, url)
+                );
+                CREATE INDEX IF NOT EXISTS images_source ON images (query, source);
+                CREATE TABLE IF NOT EXISTS cursors (
+                    query TEXT NOT NULL, source TEXT NOT NULL, cursor TEXT, exhausted INTEGER NOT NULL,
+                    updated_at REAL NOT NULL, PRIMARY KEY (query, source)
+                );
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def known(self, query, source):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT image FROM images WHERE query = ? AND source = ? ORDER BY rowid", (query, source)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # One transaction per page of results, not per image
+    def record(self, query, source, images):
+        if not images:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO images (query, source, url, image) VALUES (?, ?, ?, ?)",
+                [(query, source, image["url"], json.dumps(image)) for image in images],
+            )
+            self._db.commit()
+
+    def cursor(self, query, source):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT cursor, exhausted, updated_at FROM cursors WHERE query = ? AND source = ?", (query, source)
+            ).fetchone()
+        if row is None:
+            return Cursor()
+        # Sites add images over time, so a finished search is tried again once in a while
+        exhausted = bool(row[1]) and time.time() - row[2] < self.recheck_seconds
+        return Cursor(json.loads(row[0]) if row[0] else None, exhausted)
+
+    def save_cursor(self, query, source, cursor):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cursors (query, source, cursor, exhausted, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (query, source, json.dumps(cursor.value), int(cursor.exhausted), time.time()),
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+query_index = QueryIndex() if QUERY_INDEX_PATH else None
@@ -0,0 +1,76 @@
+import threading
+
+
+# ===== Shared image quota for sources that scrape at the same time =====
+# Every source starts with an equal share of the total. A source must claim a slot before
+# downloading an image and then report whether the download worked. When a source runs out
+# of results, its unclaimed share goes to a common pool that the sources still producing
+# can draw from. Failed downloads give their slot back.
+class QuotaLedger:
+    def __init__(self, total, sources):
+        self.total = total
+        self.available = {}
+        base, extra = divmod(total, len(sources))
+        for i, source in enumerate(sources):
+            self.available[source] = base + (1 if i < extra else 0)
+        self.active = set(sources)
+        self.pool = 0
+        self.in_flight = 0
+        self.succeeded = 0
+        self.stopped = False
+        self.done_event = threading.Event()  # lets sources stop scrolling without waiting for a new URL
+        self._cond = threading.Condition()
+        if total <= 0:
+            self.done_event.set()
+
+    # Blocks while this source has no quota but others might still free some up
+    def claim(self, source):
+        with self._cond:
+            while True:
+                if self.stopped or self.succeeded >= self.total:
+                    return False
+                if self.available.get(source, 0) > 0:
+                    self.available[source] -= 1
+                    break
+                if self.pool > 0:
+                    self.pool -= 1
+                    break
+                if self.in_flight == 0 and not (self.active - {source}):
+                    return False
+                self._cond.wait()
+            self.in_flight += 1
+            return True
+
+    def succeed(self, source):
+        with self._cond:
+            self.in_flight -= 1
+            self.succeeded += 1
+            if self.succeeded >= self.total:
+                self.done_event.set()
+                self._cond.notify_all()
+
+    def fail(self, source):
+        with self._cond:
+            self.in_flight -= 1
+            if source in self.active:
+                self.available[source] = self.available.get(source, 0) + 1
+            else:
+                self.pool += 1
+            self._cond.notify_all()
+
+    # The source has no more results: hand its unused share to the others
+    def finish(self, source):
+        with self._cond:
+            self.active.discard(source)
+            self.pool += self.available.pop(source, 0)
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self.stopped = True
+            self.done_event.set()
+            self._cond.notify_all()
+
+    def is_done(self):
+        with self._cond:
+            return self.stopped or self.succeeded >= self.total
@@ -0,0 +1,48 @@
+import math
+import threading
+import time
+
+from config import CLIENT_BURST, CLIENT_RATE_LIMIT
+
+
+# ===== New jobs per client =====
+# One token bucket per client address: it holds up to `burst` jobs and refills at `per_minute`.
+# Unlike the downloader's bucket this one never sleeps, a client over its rate is told when to retry.
+class ClientRateLimiter:
+    def __init__(self, per_minute=CLIENT_RATE_LIMIT, burst=CLIENT_BURST):
+        self.rate = per_minute / 60
+        self.burst = max(1, burst)
+        self.rejected = 0
+        self._buckets = {}  # client -> (tokens, last refill)
+        self._lock = threading.Lock()
+
+    # None if the client may go ahead, otherwise the seconds until it may
+    def acquire(self, client):
+        if self.rate <= 0:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[client] = (tokens, now)
+                self.rejected += 1
+                return max(1, math.ceil((1 - tokens) / self.rate))
+            self._buckets[client] = (tokens - 1, now)
+            self._prune(now)
+            return None
+
+    # Clients whose bucket has refilled completely look the same as new ones
+    def _prune(self, now):
+        if len(self._buckets) < 1024:
+            return
+        full = self.burst / self.rate
+        for client in [c for c, (_, last) in self._buckets.items() if now - last > full]:
+            del self._buckets[client]
+
+    def stats(self):
+        with self._lock:
+            return {"clients": len(self._buckets), "rejected": self.rejected}
+
+
+rate_limiter = ClientRateLimiter()
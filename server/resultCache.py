@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from config import RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS
+from zipStream import create_zip_from_folder
+
+
+# Same request, same key: dict order and whitespace never change the hash
+def canonical_key(fields):
+    blob = json.dumps(fields, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+# ===== Finished archives of earlier requests =====
+# <key>.zip holds the archive and <key>.json when it was made and last served. Entries expire
+# after the TTL, and the least recently served ones go first once the cache is over its size cap.
+class ResultCache:
+    def __init__(self, folder=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES, ttl=RESULT_CACHE_TTL_SECONDS):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    # Called from the server's startup hook rather than on import: process pool workers re-import
+    # the server module and must not delete the .part files the server is writing at that moment
+    def start(self):
+        os.makedirs(self.folder, exist_ok=True)
+        self._load()
+
+    def path(self, key):
+        return os.path.join(self.folder, f"{key}.zip")
+
+    # Path of a fresh archive for this key, or None
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry["created"] > self.ttl or not os.path.exists(self.path(key)):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            entry["last_used"] = time.time()
+            self._save_entry(key, entry)
+            self.hits += 1
+            return self.path(key)
+
+    # Hardlinks a zip that already exists on disk
+    def store_file(self, key, zip_path):
+        tmp_path = self.path(key) + ".part"
+        try:
+            os.link(zip_path, tmp_path)
+        except OSError:
+            shutil.copy(zip_path, tmp_path)
+        self._commit(key, tmp_path)
+
+    # Streamed jobs never wrote a zip, so build one from the processed folder
+    def store_folder(self, key, folder):
+        tmp_path = self.path(key) + ".part"
+        create_zip_from_folder(folder, tmp_path)
+        self._commit(key, tmp_path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": sum(e["size"] for e in self._entries.values()),
+            }
+
+    def _commit(self, key, tmp_path):
+        os.replace(tmp_path, self.path(key))
+        now = time.time()
+        entry = {"created": now, "last_used": now, "size": os.path.getsize(self.path(key))}
+        with self._lock:
+            self._entries[key] = entry
+            self._save_entry(key, entry)
+            self._evict()
+        print(f"🗄️ Cached result {key[:12]} ({entry['size'] / 1024**2:.1f} MB)")
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, e in self._entries.items() if now - e["created"] > self.ttl]:
+            self._remove(key)
+        total = sum(e["size"] for e in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= self._entries[key]["size"]
+            self._remove(key)
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        for path in (self.path(key), os.path.join(self.folder, f"{key}.json")):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _save_entry(self, key, entry):
+        with open(os.path.join(self.folder, f"{key}.json"), "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+
+    # Pick up what earlier server runs left behind
+    def _load(self):
+        entries = {}
+        for name in os.listdir(self.folder):
+            if name.endswith(".part"):
+                os.remove(os.path.join(self.folder, name))
+            elif name.endswith(".json"):
+                key = name[:-len(".json")]
+                try:
+                    with open(os.path.join(self.folder, name), encoding="utf-8") as f:
+                        entries[key] = json.load(f)
+                except (OSError, ValueError):
+                    continue
+        with self._lock:
+            self._entries.update(entries)
+            self._evict()
+
+
+result_cache = ResultCache()
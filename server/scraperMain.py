@@ -1,225 +1,380 @@
+import json
 import os
-import time
-import requests
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from itertools import count, islice
 from tqdm import tqdm
-from urllib.parse import quote, urljoin
-from bs4 import BeautifulSoup
-
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-
-# Initialize Selenium driver
-def init_driver():
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1920x1080")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    service = Service(ChromeDriverManager().install())
-    return webdriver.Chrome(service=service, options=chrome_options)
+from urllib.parse import quote
+
+from config import SCRAPE_BACKEND, SCRAPE_MODE, SCROLL_NO_GROWTH_LIMIT
+from downloader import downloader
+from driverPool import DriverUnavailable, driver_pool
+from httpSources import http_picjumbo_images, http_wikimedia_images, parse_picjumbo_page, picjumbo_page_url
+from queryIndex import normalize_query, query_index
+from quota import QuotaLedger
+from scrollEngine import ScrollEngine
+
+# Each source is a generator that yields {"url", "width", "height", "alt"} for every new image as it
+# finds them. The caller decides when it has enough and closes the generator (or sets stop_event),
+# which hands the browser back to the pool. Sources that can paginate start from position.value
+# and move it forward as their results are taken (see queryIndex.Cursor).
 
 # ===== Picjumbo Images =====
-def scrape_picjumbo(query, total_images, dest_folder, start_num):
-    driver = init_driver()
-    base_url = f"https://picjumbo.com/search/{query.lower().replace(' ', '-')}/"
+def browser_picjumbo_images(query, job=None, stop_event=None, position=None):
     image_urls = set()
-    page_number = 1
-    scroll_pause_time = 2
+    page_number = position.value if position and position.value else 1
 
     print("\n🔎 Scraping Picjumbo Images...")
-    while len(image_urls) < total_images:
-        page_url = base_url if page_number == 1 else f"{base_url.rstrip('/')}/page/{page_number}/"
-        print(f"🌐 Visiting: {page_url}")
-        driver.get(page_url)
-        time.sleep(scroll_pause_time)
-
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        picture_tags = soup.find_all("picture")
-
-        new_images_found = 0
-        for picture in picture_tags:
-            img = picture.find("img")
-            if img and img.get("class") == ["image"]:
-                src = img.get("src")
-                if src:
-                    if src.startswith("//"):
-                        src = "https:" + src
-                    elif src.startswith("/"):
-                        src = urljoin("https://picjumbo.com", src)
-                    if src not in image_urls:
-                        image_urls.add(src)
-                        new_images_found += 1
-
-            if len(image_urls) >= total_images:
+    with driver_pool.driver(job, stop_event) as driver:
+        engine = ScrollEngine(driver, "Picjumbo")
+        while True:
+            if job:
+                job.check_cancelled()
+            if stop_event is not None and stop_event.is_set():
                 break
+            page_url = picjumbo_page_url(query, page_number)
+            print(f"🌐 Visiting: {page_url}")
+            engine.load(page_url)
 
-        if new_images_found == 0:
-            print("⚠️ No new images found on this page. Stopping further scraping.")
-            break
-
-        page_number += 1
-
-    driver.quit()
-
-    download_count = min(total_images, len(image_urls))
-    print(f"\n📥 Downloading {download_count} Picjumbo images...\n")
+            new_images = parse_picjumbo_page(driver.page_source, image_urls)
 
-    for i, url in enumerate(tqdm(list(image_urls)[:download_count], desc="Downloading Picjumbo")):
-        download_image(url, dest_folder, start_num + i)
+            if not new_images:
+                print("⚠️ No new images found on this page. Stopping further scraping.")
+                if position:
+                    position.exhausted = True
+                break
 
-    return download_count
+            page_number += 1
+            if position:
+                position.advance(page_number, new_images)
+            yield from new_images
 
 # ===== Wikimedia Images =====
-def scrape_wikimedia(query, total_images, dest_folder, start_num):
-    driver = init_driver()
+# MediaSearch has no page parameter, so the browser path always starts from the top
+def browser_wikimedia_images(query, job=None, stop_event=None, position=None):
     search_url = f"https://commons.wikimedia.org/w/index.php?search={quote(query)}&title=Special:MediaSearch&type=image"
-    driver.get(search_url)
 
     image_urls = set()
-    scroll_pause = 3
     max_scrolls = 100
+    retry_count = 0
 
     print("\n🔎 Scraping Wikimedia Images...")
-    for _ in range(max_scrolls):
-        print(len(image_urls))
-        if len(image_urls) >= total_images:
-            print(f"✅ Reached target of {total_images} images. Stopping scroll.")
-            break  # ✅ Stop scrolling once enough images are collected
-
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(scroll_pause)
+    with driver_pool.driver(job, stop_event) as driver:
+        engine = ScrollEngine(driver, "Wikimedia")
+        engine.load(search_url)
+        for scroll_num in range(max_scrolls):
+            if job:
+                job.check_cancelled()
+            if stop_event is not None and stop_event.is_set():
+                break
+            if retry_count >= SCROLL_NO_GROWTH_LIMIT:
+                print("⚠️ No new Wikimedia results after scrolling. Stopping.")
+                break
 
-        try:
-            load_more_button = driver.find_element(By.CLASS_NAME, "sdms-load-more")
-            if load_more_button.is_displayed():
-                driver.execute_script("arguments[0].click();", load_more_button)
-                print(f"🔘 Clicked 'Load more' button (Scroll {scroll_num+1}).")
-                time.sleep(scroll_pause)
-        except Exception as e:
-            print("ℹ️ No 'Load more' button found this round.")
-
-        thumbnails = driver.find_elements(By.CLASS_NAME, "sd-image")
-        for thumb in thumbnails:
-            if len(image_urls) >= total_images:
-                break  # ✅ Stop collecting further if target met
-            try:
-                src = thumb.get_attribute("src")
-                if src and src.startswith("http") and "upload.wikimedia.org" in src:
+            # Returns as soon as more thumbnails appear instead of sleeping a fixed time
+            if engine.scroll(".sd-image", ".sdms-load-more"):
+                retry_count = 0
+            else:
+                retry_count += 1
+
+            # One script call returns only the thumbnails added since the last scroll
+            new_images = []
+            for image in engine.extract_new("img.sd-image"):
+                src = image["url"]
+                if src and src.startswith("http") and "upload.wikimedia.org" in src and src not in image_urls:
                     image_urls.add(src)
-            except:
-                continue
-
-        print(f"🔗 Wikimedia collected {len(image_urls)} image links...")
+                    new_images.append(image)
 
-    driver.quit()
-
-    download_count = min(total_images, len(image_urls))
-    print(f"\n📥 Downloading {download_count} Wikimedia images...\n")
-
-    for i, url in enumerate(tqdm(list(image_urls)[:download_count], desc="Downloading Wikimedia")):
-        download_image(url, dest_folder, start_num + i)
-
-    return download_count
+            print(f"🔗 Wikimedia collected {len(image_urls)} image links...")
+            yield from new_images
 
 # ===== Yahoo Images =====
-def scrape_yahoo(query, total_images, dest_folder, start_num):
-    driver = init_driver()
+def yahoo_images(query, job=None, stop_event=None, position=None):
+    offset = position.value if position and position.value else 0
     search_url = f"https://images.search.yahoo.com/search/images?p={quote(query)}"
-    driver.get(search_url)
+    if offset:
+        search_url += f"&b={offset + 1}"  # b= is the 1-based index of the first result
 
     image_urls = set()
-    last_height = driver.execute_script("return document.body.scrollHeight")
-    scroll_pause = 2
-    retry_limit = 3
     retry_count = 0
 
     print("\n🔎 Scraping Yahoo Images...")
-    while len(image_urls) < total_images and retry_count < retry_limit:
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(scroll_pause)
+    with driver_pool.driver(job, stop_event) as driver:
+        engine = ScrollEngine(driver, "Yahoo")
+        engine.load(search_url)
+        while retry_count < SCROLL_NO_GROWTH_LIMIT:
+            if job:
+                job.check_cancelled()
+            if stop_event is not None and stop_event.is_set():
+                break
 
-        try:
-            show_more_button = driver.find_element(By.CLASS_NAME, "more-res")
-            if show_more_button.is_displayed():
-                driver.execute_script("arguments[0].click();", show_more_button)
-                print("🔘 Clicked 'Show more images' button.")
-                time.sleep(2)
-        except:
-            pass
-
-        thumbnails = driver.find_elements(By.CLASS_NAME, "round-img")
-        for thumb in thumbnails:
-            try:
-                img = thumb.find_element(By.TAG_NAME, "img")
-                src = img.get_attribute("src")
-                if src and src.startswith("http"):
-                    image_urls.add(src)
-            except:
-                continue
+            if engine.scroll(".round-img", ".more-res"):
+                retry_count = 0
+            else:
+                retry_count += 1
 
-        print(f"🔗 Yahoo collected {len(image_urls)} image links...")
+            new_images = []
+            for image in engine.extract_new(".round-img img"):
+                src = image["url"]
+                if src and src.startswith("http") and src not in image_urls:
+                    image_urls.add(src)
+                    new_images.append(image)
 
-        new_height = driver.execute_script("return document.body.scrollHeight")
-        if new_height == last_height:
-            retry_count += 1
+            print(f"🔗 Yahoo collected {len(image_urls)} image links...")
+            if position:
+                position.advance(offset + len(image_urls), new_images)
+            yield from new_images
         else:
-            retry_count = 0
-        last_height = new_height
+            if position:
+                position.exhausted = True
+
+# ===== Browserless fast path =====
+# Picjumbo and Wikimedia can be scraped with plain HTTP. Selenium only takes over when that fails,
+# skipping anything the HTTP backend already yielded.
+def with_fallback(name, fast, slow, query, job=None, stop_event=None, position=None):
+    seen = set()
+    if SCRAPE_BACKEND == "http":
+        try:
+            with closing(fast(query, job, stop_event, position)) as found:
+                for image in found:
+                    seen.add(image["url"])
+                    yield image
+            return
+        except Exception as e:
+            if job and job.is_cancelled():
+                raise
+            print(f"⚠️ {name} HTTP backend failed ({e}), falling back to the browser.")
+    with closing(slow(query, job, stop_event, position)) as found:
+        for image in found:
+            if image["url"] not in seen:
+                yield image
+
+def picjumbo_images(query, job=None, stop_event=None, position=None):
+    return with_fallback("Picjumbo", http_picjumbo_images, browser_picjumbo_images, query, job, stop_event, position)
+
+def wikimedia_images(query, job=None, stop_event=None, position=None):
+    return with_fallback("Wikimedia", http_wikimedia_images, browser_wikimedia_images, query, job, stop_event, position)
+
+# Sources in order of preference
+SOURCES = {
+    "Picjumbo": picjumbo_images,
+    "Wikimedia": wikimedia_images,
+    "Yahoo": yahoo_images,
+}
+
+# ===== Incremental scraping =====
+# Replays what earlier jobs found for the same query, then continues the source from the cursor
+# it reached last time instead of page one. New finds and the cursor go back into the index.
+def indexed_images(source, query, job=None, stop_event=None):
+    key = normalize_query(query)
+    seen = set()
+    known = query_index.known(key, source)
+    if known:
+        print(f"📚 {source}: reusing {len(known)} known images for '{key}'")
+    for image in known:
+        if job:
+            job.check_cancelled()
+        if stop_event is not None and stop_event.is_set():
+            return
+        seen.add(image["url"])
+        yield image
+
+    position = query_index.cursor(key, source)
+    if position.exhausted:
+        return
+    # Sources advance the cursor before yielding a page, so the whole page is indexed at once,
+    # including images the job stops before. Sources without pages are indexed in batches.
+    recorded_page = position.page
+    pending = []
+    try:
+        with closing(SOURCES[source](query, job, stop_event, position)) as found:
+            for image in found:
+                if position.page is not recorded_page:
+                    recorded_page = position.page
+                    query_index.record(key, source, recorded_page)
+                if image["url"] in seen:
+                    continue
+                seen.add(image["url"])
+                if image not in recorded_page:
+                    pending.append(image)
+                    if len(pending) >= 50:
+                        query_index.record(key, source, pending)
+                        pending = []
+                yield image
+    finally:
+        query_index.record(key, source, pending)
+        query_index.save_cursor(key, source, position)
+
+def find_images(source, query, job=None, stop_event=None):
+    if query_index is None:
+        return SOURCES[source](query, job, stop_event)
+    return indexed_images(source, query, job, stop_event)
+
+# ===== One source at a time =====
+def scrape_source(source, query, total_images, dest_folder, start_num, job=None):
+    with closing(find_images(source, query, job)) as found:
+        images = list(islice(found, total_images))
+
+    download_count = len(images)
+    print(f"\n📥 Downloading {download_count} {source} images...\n")
+
+    download_all(images, dest_folder, start_num, source, job)
 
-    driver.quit()
+    return download_count
 
-    download_count = min(total_images, len(image_urls))
-    print(f"\n📥 Downloading {download_count} Yahoo images...\n")
+def scrape_picjumbo(query, total_images, dest_folder, start_num, job=None):
+    return scrape_source("Picjumbo", query, total_images, dest_folder, start_num, job)
 
-    for i, url in enumerate(tqdm(list(image_urls)[:download_count], desc="Downloading Yahoo")):
-        download_image(url, dest_folder, start_num + i)
+def scrape_wikimedia(query, total_images, dest_folder, start_num, job=None):
+    return scrape_source("Wikimedia", query, total_images, dest_folder, start_num, job)
 
-    return download_count
+def scrape_yahoo(query, total_images, dest_folder, start_num, job=None):
+    return scrape_source("Yahoo", query, total_images, dest_folder, start_num, job)
 
-# ===== Download Helper =====
-def download_image(img_url, dest_folder, img_num):
+# ===== All sources at once =====
+# Runs one source until the ledger says stop, handing every claimed image to handle_image(source, image)
+def discover_source(source, query, ledger, handle_image, job=None):
+    try:
+        with closing(find_images(source, query, job, ledger.done_event)) as found:
+            for image in found:
+                if not ledger.claim(source):
+                    break
+                if job and job.is_cancelled():
+                    ledger.fail(source)
+                    job.check_cancelled()
+                handle_image(source, image)
+    except DriverUnavailable:
+        pass  # the quota filled up while this source waited for a browser
+    except Exception:
+        # One broken source must not stall the others waiting for its quota
+        if job and job.is_cancelled():
+            ledger.stop()
+            raise
+        traceback.print_exc()
+    finally:
+        ledger.finish(source)
+
+# Downloads a claimed image and settles the claim, returns the file name or None.
+# The claim is settled whatever happens, otherwise sources wait in ledger.claim() forever.
+def download_claimed(source, image, ledger, dest_folder, image_numbers, job=None):
+    if job and job.is_cancelled():
+        ledger.fail(source)
+        return None
+    img_num = next(image_numbers)
     try:
-        response = requests.get(img_url, stream=True, timeout=10)
-        if response.status_code == 200:
-            file_ext = os.path.splitext(img_url)[1].split('?')[0]
-            if not file_ext or len(file_ext) > 5:
-                file_ext = ".jpg"
+        if download_image(image["url"], dest_folder, img_num):
             filename = f"{img_num}.jpg"
-            file_path = os.path.join(dest_folder, filename)
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(1024):
-                    f.write(chunk)
+            record_image(dest_folder, filename, source, image)
+            ledger.succeed(source)
+            if job:
+                job.increment("downloaded")
+            return filename
     except Exception as e:
-        tqdm.write(f"[!] Failed to download {img_url[:50]}... Reason: {e}")
+        print(f"❌ Failed to download {image['url']}: {e}")
+    ledger.fail(source)
+    return None
+
+def fanout_scrape(query, total_images, dest_folder, job=None):
+    ledger = QuotaLedger(total_images, list(SOURCES))
+    image_numbers = count(1)
+
+    downloads = []
+
+    # Sources keep scrolling while the downloader works through what they found
+    def handle_image(source, image):
+        downloads.append(downloader.submit_task(download_claimed, source, image, ledger, dest_folder, image_numbers, job))
+
+    with ThreadPoolExecutor(max_workers=len(SOURCES), thread_name_prefix="source") as executor:
+        futures = [
+            executor.submit(discover_source, source, query, ledger, handle_image, job)
+            for source in SOURCES
+        ]
+        for f in futures:
+            f.result()
+    for f in list(downloads):
+        f.result()
+    return ledger.succeeded
+
+# ===== Download Helper =====
+# Downloads go through the shared connection-pooled downloader, several at a time
+def download_all(images, dest_folder, start_num, source, job=None):
+    futures = {
+        downloader.submit(image["url"], os.path.join(dest_folder, f"{start_num + i}.jpg")): (start_num + i, image)
+        for i, image in enumerate(images)
+    }
+    try:
+        for f in tqdm(as_completed(futures), total=len(futures), desc=f"Downloading {source}"):
+            if job:
+                job.check_cancelled()
+            if f.result():
+                img_num, image = futures[f]
+                record_image(dest_folder, f"{img_num}.jpg", source, image)
+                if job:
+                    job.increment("downloaded")
+    finally:
+        for f in futures:
+            f.cancel()
+
+def download_image(img_url, dest_folder, img_num):
+    filename = f"{img_num}.jpg"
+    return downloader.fetch(img_url, os.path.join(dest_folder, filename))
+
+# ===== Manifest =====
+# One JSON line per downloaded file with where it came from, kept next to the images
+MANIFEST_NAME = "manifest.jsonl"
+_manifest_lock = threading.Lock()
+
+def record_image(dest_folder, filename, source, image):
+    entry = {"file": filename, "source": source, **image}
+    with _manifest_lock:
+        with open(os.path.join(dest_folder, MANIFEST_NAME), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+
+def load_manifest(folder):
+    path = os.path.join(folder, MANIFEST_NAME)
+    entries = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["file"]] = entry
+    return entries
 
 # ===== Main Controller =====
-def imageScraper(queryOfImage, numberOfImages):
+def imageScraper(queryOfImage, numberOfImages, job=None, dest_folder=None, mode=SCRAPE_MODE):
     query = queryOfImage
     total_images = numberOfImages
 
-    dest_folder = f"./images_{query.replace(' ', '_')}"
+    # Jobs pass their own workspace folder so concurrent requests never share files
+    if dest_folder is None:
+        dest_folder = f"./images_{query.replace(' ', '_')}"
     os.makedirs(dest_folder, exist_ok=True)
 
+    if mode == "fanout":
+        # Query every source at once, each with a share of the total
+        downloaded_so_far = fanout_scrape(query, total_images, dest_folder, job)
+        print(f"\n🎉 All done! Downloaded {downloaded_so_far} images into '{dest_folder}' folder.")
+        return dest_folder
+
     downloaded_so_far = 0
 
     # Step 1: Picjumbo
-    picjumbo_count = scrape_picjumbo(query, total_images, dest_folder, downloaded_so_far + 1)
+    picjumbo_count = scrape_picjumbo(query, total_images, dest_folder, downloaded_so_far + 1, job)
     downloaded_so_far += picjumbo_count
 
     if downloaded_so_far < total_images:
         # Step 2: Wikimedia
         remaining = total_images - downloaded_so_far
-        wikimedia_count = scrape_wikimedia(query, remaining, dest_folder, downloaded_so_far + 1)
+        wikimedia_count = scrape_wikimedia(query, remaining, dest_folder, downloaded_so_far + 1, job)
         downloaded_so_far += wikimedia_count
 
     if downloaded_so_far < total_images:
         # Step 3: Yahoo
         remaining = total_images - downloaded_so_far
-        yahoo_count = scrape_yahoo(query, remaining, dest_folder, downloaded_so_far + 1)
+        yahoo_count = scrape_yahoo(query, remaining, dest_folder, downloaded_so_far + 1, job)
         downloaded_so_far += yahoo_count
 
     print(f"\n🎉 All done! Downloaded {downloaded_so_far} images into '{dest_folder}' folder.")
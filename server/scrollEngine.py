@@ -0,0 +1,109 @@
+import threading
+import time
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+from config import SCROLL_MIN_TIMEOUT, SCROLL_TIMEOUT
+
+# Scrolls to the bottom and clicks the "load more" button if it is visible, in one round trip
+_SCROLL_SCRIPT = """
+window.scrollTo(0, document.body.scrollHeight);
+var button = arguments[0] ? document.querySelector(arguments[0]) : null;
+if (button && button.offsetParent !== null) { button.click(); return true; }
+return false;
+"""
+
+_COUNT_SCRIPT = "return document.querySelectorAll(arguments[0]).length;"
+
+# Returns url/size/alt for matching images not returned before and marks them as seen,
+# so each call only pays for the results added since the last one
+_EXTRACT_SCRIPT = """
+var images = document.querySelectorAll(arguments[0] + ':not([data-nc-seen])');
+var found = [];
+for (var i = 0; i < images.length; i++) {
+    var img = images[i];
+    var url = img.currentSrc || img.src || img.getAttribute('src') || '';
+    // Lazy thumbnails start empty or as a data: placeholder, pick them up once the real URL is in
+    if (url.indexOf('http') !== 0) {
+        continue;
+    }
+    img.setAttribute('data-nc-seen', '1');
+    found.push({
+        url: url,
+        width: img.naturalWidth || img.width || null,
+        height: img.naturalHeight || img.height || null,
+        alt: img.alt || ''
+    });
+}
+return found;
+"""
+
+
+# ===== Learned per-source load time =====
+# Moving average of how long a source takes to show new results. Used to pick how often
+# to poll and how long to wait before deciding nothing more is coming.
+class LoadTimer:
+    def __init__(self, initial=2.0, smoothing=0.3):
+        self.average = initial
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.average = (1 - self.smoothing) * self.average + self.smoothing * seconds
+
+    def poll_interval(self):
+        return min(0.5, max(0.05, self.average / 5))
+
+    def timeout(self):
+        return min(SCROLL_TIMEOUT, max(SCROLL_MIN_TIMEOUT, self.average * 3))
+
+
+_timers = {}
+_timers_lock = threading.Lock()
+
+
+def load_timer(source):
+    with _timers_lock:
+        if source not in _timers:
+            _timers[source] = LoadTimer()
+        return _timers[source]
+
+
+# ===== Event-driven scroll / paginate engine =====
+# Waits on page conditions instead of sleeping a fixed time after every scroll or click.
+class ScrollEngine:
+    def __init__(self, driver, source):
+        self.driver = driver
+        self.timer = load_timer(source)
+
+    def _wait(self, condition, timeout=None, learn=True):
+        timeout = timeout or self.timer.timeout()
+        started = time.monotonic()
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=self.timer.poll_interval()).until(condition)
+        except TimeoutException:
+            return False
+        if learn:
+            self.timer.record(time.monotonic() - started)
+        return True
+
+    def count(self, selector):
+        return self.driver.execute_script(_COUNT_SCRIPT, selector)
+
+    def extract_new(self, selector):
+        return self.driver.execute_script(_EXTRACT_SCRIPT, selector) or []
+
+    # Opens a page and returns as soon as the document has finished loading
+    def load(self, url):
+        self.driver.get(url)
+        return self._wait(lambda d: d.execute_script("return document.readyState") == "complete", SCROLL_TIMEOUT, learn=False)
+
+    # Scrolls once and waits until more elements matching selector exist, returns False on timeout
+    def scroll(self, selector, load_more_selector=None):
+        before = self.count(selector)
+        clicked = self.driver.execute_script(_SCROLL_SCRIPT, load_more_selector)
+        if clicked:
+            print(f"🔘 Clicked '{load_more_selector}' button.")
+        return self._wait(lambda d: d.execute_script(_COUNT_SCRIPT, selector) > before)
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+
+from config import WORKSPACE_ROOT
+
+
+# ===== One scrape for every job asking for the same images =====
+class ScrapeFlight:
+    def __init__(self, key, folder):
+        self.key = key
+        self.folder = folder
+        self.refs = 1
+        self.ok = False
+        self.done = threading.Event()
+
+
+# Jobs with the same query and image count share one raw folder. The first job (the leader)
+# scrapes and downloads into it; the others wait for that and only run their own processing.
+# The folder lives until the last job using it leaves.
+class ScrapeFlights:
+    def __init__(self, root=os.path.join(WORKSPACE_ROOT, "_shared")):
+        self.root = root
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    # Returns (flight, True) for the job that has to do the scraping, (flight, False) for the rest
+    def join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.refs += 1
+                return flight, False
+            # A later flight for the same key must not reuse a folder the last one is still deleting
+            digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+            folder = os.path.join(self.root, f"{digest}-{uuid.uuid4().hex}")
+            os.makedirs(folder, exist_ok=True)
+            flight = self._flights[key] = ScrapeFlight(key, folder)
+            return flight, True
+
+    # Only the first call counts, so the leader can always report failure on the way out
+    def finish(self, flight, ok):
+        with self._lock:
+            if flight.done.is_set():
+                return
+            flight.ok = ok
+            flight.done.set()
+
+    # True once the leader's downloads are complete, False if it failed or was cancelled
+    def wait(self, flight, job=None):
+        while not flight.done.wait(0.5):
+            if job:
+                job.check_cancelled()
+        return flight.ok
+
+    def leave(self, flight):
+        with self._lock:
+            flight.refs -= 1
+            if flight.refs > 0:
+                return
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        shutil.rmtree(flight.folder, ignore_errors=True)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+scrape_flights = ScrapeFlights()
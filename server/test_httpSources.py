@@ -0,0 +1,119 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import httpSources
+from queryIndex import Cursor
+
+# ===== Local stand-in for Picjumbo and the Wikimedia API =====
+PICJUMBO_PAGES = {
+    "/search/red-cats/": ["/uploads/a.jpg", "//cdn.example/b.jpg"],
+    "/search/red-cats/page/2/": ["/uploads/b-dup.jpg", "//cdn.example/b.jpg", "/uploads/c.jpg"],
+}
+
+WIKIMEDIA_BATCHES = {
+    # first request carries continue="" and no offset
+    None: {
+        "continue": {"gsroffset": "2", "continue": "gsroffset||"},
+        "query": {"pages": {
+            "20": {"index": 2, "title": "File:Second.jpg", "imageinfo": [
+                {"url": "https://upload.example/2.jpg", "mime": "image/jpeg", "width": 20, "height": 10}]},
+            "10": {"index": 1, "title": "File:First.png", "imageinfo": [
+                {"url": "https://upload.example/1.png", "mime": "image/png", "width": 10, "height": 10}]},
+        }},
+    },
+    "2": {
+        "query": {"pages": {
+            "30": {"index": 3, "title": "File:Clip.gif", "imageinfo": [
+                {"url": "https://upload.example/3.gif", "mime": "image/gif", "width": 5, "height": 5}]},
+            "40": {"index": 4, "title": "File:Third.jpg", "imageinfo": [
+                {"url": "https://upload.example/4.jpg", "mime": "image/jpeg", "width": 40, "height": 30}]},
+        }},
+    },
+}
+
+
+def picjumbo_html(sources):
+    pictures = "".join(f'<picture><img class="image" src="{src}" alt="cat"></picture>' for src in sources)
+    return f"<html><body>{pictures}<picture><img class='thumb' src='/skip.jpg'></picture></body></html>"
+
+
+class StandIn(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        StandIn.requests.append(self.path)
+        if url.path == "/w/api.php":
+            offset = parse_qs(url.query).get("gsroffset", [None])[0]
+            self._send(200, "application/json", json.dumps(WIKIMEDIA_BATCHES[offset]))
+        elif url.path in PICJUMBO_PAGES:
+            self._send(200, "text/html", picjumbo_html(PICJUMBO_PAGES[url.path]))
+        else:
+            self._send(404, "text/html", "not found")
+
+    def _send(self, status, content_type, body):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(httpSources, "PICJUMBO_BASE_URL", base)
+    monkeypatch.setattr(httpSources, "WIKIMEDIA_API_URL", f"{base}/w/api.php")
+    StandIn.requests = []
+    yield base
+    server.shutdown()
+    server.server_close()
+
+
+def test_picjumbo_yields_pages_in_order_and_stops_at_the_end(stand_in):
+    position = Cursor()
+    urls = [image["url"] for image in httpSources.http_picjumbo_images("Red Cats", position=position)]
+
+    assert urls == [
+        f"{stand_in}/uploads/a.jpg",
+        "https://cdn.example/b.jpg",
+        f"{stand_in}/uploads/b-dup.jpg",
+        f"{stand_in}/uploads/c.jpg",
+    ]
+    assert position.exhausted
+    assert position.value == 3
+    # One batch of HTTP_PAGE_CONCURRENCY pages, nothing fetched past the 404
+    assert len(StandIn.requests) == httpSources.HTTP_PAGE_CONCURRENCY
+
+
+def test_picjumbo_resumes_from_the_cursor(stand_in):
+    urls = [image["url"] for image in httpSources.http_picjumbo_images("red cats", position=Cursor(2))]
+
+    assert urls == [f"{stand_in}/uploads/b-dup.jpg", "https://cdn.example/b.jpg", f"{stand_in}/uploads/c.jpg"]
+    assert "/search/red-cats/" not in StandIn.requests
+
+
+def test_wikimedia_follows_continue_until_it_runs_out(stand_in):
+    position = Cursor()
+    images = list(httpSources.http_wikimedia_images("cats", position=position))
+
+    assert [image["url"] for image in images] == [
+        "https://upload.example/1.png",
+        "https://upload.example/2.jpg",
+        "https://upload.example/4.jpg",
+    ]
+    assert images[0]["alt"] == "File:First.png"
+    assert position.exhausted
+    assert position.value is None
+    assert len(StandIn.requests) == 2
+    assert "gsroffset=2" in StandIn.requests[1]
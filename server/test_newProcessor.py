@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from newProcessor import (
+    OutputPolicy, build_plan, compile_plan, flip_image, resize_image, rotate_image, transform_batch, transform_image,
+)
+
+STEP_MAP = {
+    "1": ("resize", resize_image),
+    "4": ("rotate", rotate_image),
+    "8": ("flip", flip_image),
+}
+
+
+def random_images(n, shape=(12, 16, 3), seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, shape, dtype=np.uint8) for _ in range(n)]
+
+
+# The vectorized backend must write exactly what the per-image path writes
+@pytest.mark.parametrize("flip_code", [0, 1, -1, 2])
+def test_batch_flip_matches_per_image_plan(flip_code):
+    plan = compile_plan(["1", "8"], STEP_MAP, {"resize": [8, 6], "flip": flip_code})
+    files = [f"{i}.jpg" for i in range(3)]
+    images = random_images(len(files))
+
+    batched = transform_batch(files, images, plan)
+
+    for img_file, img, outputs in zip(files, images, batched):
+        expected = transform_image(img_file, img, plan)
+        assert [name for name, _ in outputs] == [name for name, _ in expected]
+        for (_, got), (_, want) in zip(outputs, expected):
+            np.testing.assert_array_equal(got, want)
+
+
+# "final" is the last step by position, so an earlier step with the same name is not written
+def test_keep_final_writes_only_the_last_step_when_names_repeat():
+    plan = build_plan(["1", "4", "1"], STEP_MAP, {"resize": [8, 6], "rotate": 10}, OutputPolicy(keep="final"))
+
+    assert [(step.names, step.save) for step in plan] == [(["resize", "rotate"], False), (["resize"], True)]
+    outputs = transform_image("0.jpg", random_images(1)[0], plan)
+    assert [name for name, _ in outputs] == ["0_resize_rotate_resize"]
@@ -0,0 +1,42 @@
+import os
+import re
+import shutil
+
+from config import WORKSPACE_ROOT
+
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+# ===== Per-job folders =====
+# Every job gets <WORKSPACE_ROOT>/<job_id>/ with its own raw downloads, processed output and archive,
+# so concurrent jobs never see each other's files.
+class Workspace:
+    def __init__(self, job_id):
+        if not is_safe_name(job_id):
+            raise ValueError(f"Invalid job id: {job_id}")
+        self.job_id = job_id
+        self.root = os.path.join(WORKSPACE_ROOT, job_id)
+        self.raw = os.path.join(self.root, "raw")
+        self.processed = os.path.join(self.root, "processed")
+        self.archive = os.path.join(self.root, "archive")
+
+    def create(self):
+        for folder in (self.raw, self.processed, self.archive):
+            os.makedirs(folder, exist_ok=True)
+        return self
+
+    def exists(self):
+        return os.path.isdir(self.root)
+
+    # Resolve a file the client asked for inside the archive folder, or None
+    def archive_file(self, filename):
+        if not is_safe_name(filename):
+            return None
+        return os.path.join(self.archive, filename)
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def is_safe_name(name):
+    return bool(_SAFE_NAME.match(name)) and name not in (".", "..")
@@ -0,0 +1,76 @@
+import os
+import zipfile
+
+# JPEG/PNG/WebP are already compressed, DEFLATE only burns CPU on them
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+CHUNK_SIZE = 64 * 1024
+
+
+def compress_type_for(filename):
+    if filename.lower().endswith(STORED_EXTENSIONS):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def iter_folder_files(folder_path):
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            yield path, os.path.relpath(path, folder_path)
+
+
+# Function to zip a folder to disk
+def create_zip_from_folder(folder_path, zip_filename):
+    with zipfile.ZipFile(zip_filename, 'w') as zipf:
+        for path, arcname in iter_folder_files(folder_path):
+            zipf.write(path, arcname, compress_type=compress_type_for(arcname))
+
+
+# Write-only, non-seekable sink: zipfile falls back to data descriptors and we hand out the bytes as they come
+class _ZipBuffer:
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# ===== Streaming ZIP =====
+# Yields the archive piece by piece while reading the folder, nothing is written to disk.
+def iter_zip(folder_path, chunk_size=CHUNK_SIZE):
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w') as zipf:
+        for path, arcname in iter_folder_files(folder_path):
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = compress_type_for(arcname)
+            with open(path, 'rb') as src, zipf.open(info, 'w') as dest:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    # Central directory is written when the ZipFile closes
+    data = buffer.drain()
+    if data:
+        yield data